@@ -0,0 +1,128 @@
+"""Headless benchmarks for fourth.py (the isometric block world).
+
+Run from this directory:  python benchmark_fourth.py
+"""
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import numpy as np
+import pygame
+from fourth import GRAVEL, REGION_SIZE, SAND, SCREEN_HEIGHT, SCREEN_WIDTH, WATER, Player, World, simulate_step
+
+
+def scatter(world, count, seed=0):
+    """Drops sand, gravel and water sources at random spots in the upper half of the world."""
+    rng = random.Random(seed)
+    for _ in range(count):
+        x, z = rng.randrange(world.width), rng.randrange(world.depth)
+        world.set_block(x, rng.randrange(world.height // 2, world.height), z, rng.choice((SAND, SAND, GRAVEL, WATER)))
+
+
+def benchmark_simulation(sizes=((128, 32, 128), (256, 32, 256), (256, 64, 256)), ticks=30):
+    """Cells simulated per second with the whole world busy, with one busy spot, and at rest."""
+    for width, height, depth in sizes:
+        world = World(width, height, depth)
+        scatter(world, width * depth // 8)
+        world.activate_all()
+        start = time.perf_counter()
+        cells = 0
+        for _ in range(ticks):
+            world.tick()
+            cells += world.tick_stats['regions'] * REGION_SIZE * REGION_SIZE * height
+        busy_s = (time.perf_counter() - start) / ticks
+        busy_rate = cells / ticks / busy_s
+
+        # One sand pile and one water source in an otherwise still world
+        world = World(width, height, depth)
+        while world.active:
+            world.tick()
+        for y in range(height - 8, height):
+            world.set_block(width // 4, y, depth // 4, SAND)
+        world.set_block(width // 2, height - 1, depth // 2, WATER)
+        start = time.perf_counter()
+        regions = 0
+        for _ in range(ticks):
+            world.tick()
+            regions += world.tick_stats['regions']
+        local_ms = (time.perf_counter() - start) / ticks * 1000
+
+        while world.active:
+            world.tick()
+        start = time.perf_counter()
+        for _ in range(ticks):
+            world.tick()
+        quiet_us = (time.perf_counter() - start) / ticks * 1e6
+
+        total_regions = -(-width // REGION_SIZE) * -(-depth // REGION_SIZE)
+        print(f"simulation {width}x{height}x{depth}: busy {busy_s * 1000:.1f} ms/tick "
+              f"({busy_rate / 1e6:.1f} M cells/s), local {local_ms:.2f} ms/tick "
+              f"({regions / ticks:.1f} of {total_regions} regions), "
+              f"at rest {quiet_us:.1f} us/tick")
+
+
+def benchmark_drawing(frames=100):
+    """Full isometric redraws against redrawing only the columns the simulation changed."""
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    world, player = World(), Player(0, 0)
+    scatter(world, 40)
+
+    start = time.perf_counter()
+    for _ in range(frames):
+        world._canvas = None
+        world.draw_isometric(screen, player)
+    full_ms = (time.perf_counter() - start) / frames * 1000
+
+    columns = 0
+    start = time.perf_counter()
+    for _ in range(frames):
+        world.tick()
+        columns += len(world.dirty_columns)
+        world.draw_isometric(screen, player)
+    incremental_ms = (time.perf_counter() - start) / frames * 1000
+    print(f"draw {world.width}x{world.height}x{world.depth}: full {full_ms:.2f} ms/frame, "
+          f"tick + changed columns {incremental_ms:.2f} ms/frame ({columns / frames:.1f} columns/frame)")
+
+
+def regression_cases():
+    """Yields timed cases for ../benchmark_regression.py: isometric redraws, full and of a
+    single column, and one simulation step with every region of the world busy."""
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    player = Player(0, 0)
+    for width, height, depth in ((20, 10, 20), (64, 16, 64)):
+        world = World(width, height, depth)
+        scatter(world, width * depth // 10)
+
+        def full_redraw(world=world):
+            world._canvas = None
+            world.draw_isometric(screen, player)
+        yield f"World.draw_isometric full world={width}x{height}x{depth}", full_redraw
+
+        def changed_columns(world=world, columns=iter(range(10**9))):
+            column = next(columns) % (width * depth)
+            world.dirty_columns.add((column % width, column // width))
+            world.draw_isometric(screen, player)
+        yield f"World.draw_isometric one column world={width}x{height}x{depth}", changed_columns
+
+    for width, height, depth in ((128, 32, 128), (256, 32, 256)):
+        world = World(width, height, depth)
+        scatter(world, width * depth // 8)
+        size = REGION_SIZE + 2
+        blocks = world.padded_blocks[:, :width + 2, :depth + 2]
+        water = world.padded_water[:, :width + 2, :depth + 2]
+        # Every region of the world, busy, stepped from the same state each time
+        regions = [(slice(x, x + size), slice(z, z + size)) for x in range(0, width, REGION_SIZE) for z in range(0, depth, REGION_SIZE)]
+        stacked = np.stack([blocks[:, sx, sz] for sx, sz in regions]), np.stack([water[:, sx, sz] for sx, sz in regions])
+        yield f"simulate_step world={width}x{height}x{depth}", lambda stacked=stacked: simulate_step(*stacked)
+
+
+if __name__ == "__main__":
+    pygame.init()
+    benchmark_simulation()
+    benchmark_drawing()
+    pygame.quit()
+    sys.exit()
@@ -0,0 +1,186 @@
+"""Headless benchmarks for second.py, the tile-map RPG with generated caves.
+
+Run from this directory:  python benchmark_second.py
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import pygame
+import second
+from benchmark_common import HeldKeys, random_walls
+from second import TILE_SIZE, BakedBackground, Game, TileGrid, TileVariants, generate_cave, is_connected, load_or_generate_cave
+
+
+def make_map(width, height, wall_chance=0.2, seed=0):
+    """A map of 'W' walls and 'G' grass, as second.py reads it, walled in at the edges."""
+    walls = random_walls(width, height, wall_chance, random.Random(seed))
+    return ["".join("W" if wall else "G" for wall in row) for row in walls]
+
+
+def benchmark_collision(sizes=((30, 20), (100, 100), (1000, 1000)), moves=20000):
+    """Times TileGrid.move_and_collide on maps of increasing size. Per-move cost should stay flat."""
+    for width, height in sizes:
+        grid = TileGrid(make_map(width, height, seed=width * height), TILE_SIZE)
+        rect = pygame.Rect(TILE_SIZE, TILE_SIZE, TILE_SIZE, TILE_SIZE)
+        steps = [(3, 0), (0, 3), (-3, 0), (0, -3)]
+        start = time.perf_counter()
+        for i in range(moves):
+            dx, dy = steps[(i // 8) % 4]
+            grid.move_and_collide(rect, dx, dy)
+        elapsed = time.perf_counter() - start
+        print(f"collision {width}x{height}: {elapsed / moves * 1e6:.2f} us/move")
+
+
+def benchmark_rendering(frames=300):
+    """Compares per-tile drawing against the baked background with dirty-rect updates."""
+    game = Game()
+    screen, tile_map = game.screen, game.tile_map
+    variants, player_img = game.tile_variants, game.player_img
+    grass_img = variants.sheet.subsurface(variants.area('G', 0, 0))
+    wall_img = variants.sheet.subsurface(variants.area('W', 0, 0))
+    walls = sum(row.count('W') for row in tile_map)
+    rect = player_img.get_rect(topleft=(2 * TILE_SIZE, 2 * TILE_SIZE))
+
+    # Old approach: every grass tile, every wall and the player, then a full flip
+    start = time.perf_counter()
+    for _ in range(frames):
+        screen.fill(second.BLACK)
+        for y, row in enumerate(tile_map):
+            for x, char in enumerate(row):
+                screen.blit(grass_img, (x * TILE_SIZE, y * TILE_SIZE))
+                if char == 'W':
+                    screen.blit(wall_img, (x * TILE_SIZE, y * TILE_SIZE))
+        screen.blit(player_img, rect)
+        pygame.display.flip()
+    naive_ms = (time.perf_counter() - start) / frames * 1000
+    naive_blits = len(tile_map) * len(tile_map[0]) + walls + 1
+
+    # Baked: erase the moving sprite from the background, redraw it, update only that area
+    background = BakedBackground(tile_map, TILE_SIZE, variants)
+    background.draw(screen)
+    blits = 0
+    start = time.perf_counter()
+    for i in range(frames):
+        old_rect = rect.copy()
+        rect.x += 1 if (i // 60) % 2 == 0 else -1
+        blits += background.blit_region(screen, old_rect)
+        screen.blit(player_img, rect)
+        blits += 1
+        pygame.display.update([old_rect.union(rect)])
+    baked_ms = (time.perf_counter() - start) / frames * 1000
+
+    print(f"per-tile draw: {naive_blits} blits/frame, {naive_ms:.3f} ms/frame")
+    print(f"baked + dirty: {blits / frames:.1f} blits/frame, {baked_ms:.3f} ms/frame")
+
+
+def benchmark_game(sizes=((30, 20), (200, 200), (1000, 1000)), frames=300):
+    """Times Game construction, the first (full) frame and steady-state frames."""
+    walking = HeldKeys(pygame.K_RIGHT, pygame.K_DOWN)
+    for width, height in sizes:
+        tile_map = second.game_map if (width, height) == (30, 20) else make_map(width, height, wall_chance=0.02)
+
+        start = time.perf_counter()
+        game = Game(tile_map, player_start=(width // 2, height // 2))
+        startup_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        game.step(HeldKeys())
+        first_frame_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        for _ in range(frames):
+            game.step(HeldKeys())
+        idle_ms = (time.perf_counter() - start) / frames * 1000
+
+        start = time.perf_counter()
+        blits = 0
+        for _ in range(frames):
+            game.step(walking)
+            blits += game.last_frame_blits
+        walking_ms = (time.perf_counter() - start) / frames * 1000
+
+        print(f"game {width}x{height}: startup {startup_ms:.2f} ms, first frame {first_frame_ms:.2f} ms, "
+              f"idle {idle_ms:.3f} ms/frame, walking {walking_ms:.3f} ms/frame ({blits / frames:.1f} blits/frame)")
+
+
+def benchmark_generation(sizes=(256, 1024, 4096), seed=1):
+    """Times cave generation, connectivity validation and cached reloads."""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for size in sizes:
+            start = time.perf_counter()
+            walls = generate_cave(size, size, seed)
+            generate_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            connected = is_connected(walls)
+            validate_s = time.perf_counter() - start
+            if not connected:
+                raise AssertionError(f"{size}x{size} cave (seed {seed}) is not connected")
+
+            load_or_generate_cave(size, size, seed, cache_dir=cache_dir)
+            start = time.perf_counter()
+            load_or_generate_cave(size, size, seed, cache_dir=cache_dir)
+            cached_s = time.perf_counter() - start
+
+            print(f"cave {size}x{size}: generate {generate_s * 1000:.1f} ms "
+                  f"({size * size / generate_s / 1e6:.1f} Mcells/s), validate {validate_s * 1000:.1f} ms, "
+                  f"cached load {cached_s * 1000:.1f} ms, {(~walls).mean():.0%} open")
+
+
+def benchmark_variants(counts=(1, 8, 32), map_size=(1000, 1000)):
+    """Times texture-variant generation and compares the pool's memory with one texture per tile."""
+    Game()  # Needs a display for the sheet surface
+    width, height = map_size
+    per_tile_bytes = width * height * TILE_SIZE * TILE_SIZE * 4
+    for count in counts:
+        start = time.perf_counter()
+        variants = TileVariants(TILE_SIZE, count, seed=0)
+        generate_ms = (time.perf_counter() - start) * 1000
+        print(f"variants x{count}: generate {generate_ms:.2f} ms, {variants.memory_bytes / 1024:.0f} KiB "
+              f"(one texture per tile on {width}x{height}: {per_tile_bytes / 2**30:.1f} GiB)")
+
+
+def regression_cases():
+    """Yields timed cases for ../benchmark_regression.py: tile-grid collision, then a
+    scrolling frame on the built-in map and on 200x200 and 1000x1000 random ones."""
+    steps = [(3, 0), (0, 3), (-3, 0), (0, -3)]
+    for width, height in ((30, 20), (200, 200), (1000, 1000)):
+        grid = TileGrid(make_map(width, height, seed=width * height), TILE_SIZE)
+        rect = pygame.Rect(TILE_SIZE, TILE_SIZE, TILE_SIZE, TILE_SIZE)
+        moves = iter(range(10**9))
+        yield (f"TileGrid.move_and_collide map={width}x{height}",
+               lambda grid=grid, rect=rect, moves=moves: grid.move_and_collide(rect, *steps[next(moves) // 8 % 4]))
+
+    walking = [HeldKeys(pygame.K_RIGHT), HeldKeys(pygame.K_DOWN), HeldKeys(pygame.K_LEFT), HeldKeys(pygame.K_UP)]
+    for width, height in ((30, 20), (200, 200), (1000, 1000)):
+        tile_map = second.game_map if (width, height) == (30, 20) else make_map(width, height, wall_chance=0.02)
+        game = Game(tile_map, player_start=(width // 2, height // 2))
+        start = game.player.rect.topleft
+        moves = iter(range(10**9))
+        yield (f"Player.move_and_collide map={width}x{height}",
+               lambda game=game, moves=moves: game.player.move_and_collide(*steps[next(moves) // 8 % 4], game.tile_grid))
+
+        def step(game=game, start=start, frames=iter(range(10**9))):
+            frame = next(frames) % 120
+            if frame == 0:
+                game.player.rect.topleft = start  # Walk the same loop every time, scrolling the whole way
+            game.step(walking[frame // 30])
+        game.player.rect.topleft = start
+        game.step()
+        yield f"Game.step map={width}x{height}", step
+
+if __name__ == "__main__":
+    benchmark_collision()
+    benchmark_rendering()
+    benchmark_game()
+    benchmark_generation()
+    benchmark_variants()
+    pygame.quit()
+    sys.exit()
@@ -1,4 +1,5 @@
 import pygame
+import numpy as np
 import sys
 import random
 
@@ -8,6 +9,7 @@ SCREEN_HEIGHT = 600
 TILE_SIZE = 32
 GRID_WIDTH = 20
 GRID_HEIGHT = 20
+WORLD_HEIGHT = 10
 PLAYER_SIZE = 20
 PLAYER_SPEED = 5
 
@@ -21,25 +23,73 @@ DARK_BROWN = (101, 67, 33)
 GRAY = (128, 128, 128)
 DARK_GRAY = (100, 100, 100)
 SKY_BLUE = (135, 206, 235)
+SAND_COLOR = (220, 200, 130)
+DARK_SAND_COLOR = (190, 170, 100)
+GRAVEL_COLOR = (140, 130, 125)
+DARK_GRAVEL_COLOR = (110, 100, 95)
+WATER_COLOR = (50, 100, 220)
+DARK_WATER_COLOR = (30, 70, 180)
 
 # --- Block Types ---
+AIR = 0
 GRASS = 1
 DIRT = 2
 STONE = 3
+SAND = 4
+GRAVEL = 5
+WATER = 6
 
 BLOCK_COLORS = {
     GRASS: (GREEN, DARK_GREEN),
     DIRT: (BROWN, DARK_BROWN),
-    STONE: (GRAY, DARK_GRAY)
+    STONE: (GRAY, DARK_GRAY),
+    SAND: (SAND_COLOR, DARK_SAND_COLOR),
+    GRAVEL: (GRAVEL_COLOR, DARK_GRAVEL_COLOR),
+    WATER: (WATER_COLOR, DARK_WATER_COLOR)
 }
 
-class Block:
-    """Represents a single block in the world."""
-    def __init__(self, block_type, x, y, z):
-        self.block_type = block_type
-        self.x = x
-        self.y = y
-        self.z = z
+# --- Simulation ---
+DROP_KEYS = {pygame.K_SPACE: SAND, pygame.K_g: GRAVEL, pygame.K_f: WATER}
+FALLING_BLOCKS = (SAND, GRAVEL)  # Fall into air or water below them
+SOURCE_LEVEL = 8   # Water placed by the player; never drains
+FALL_LEVEL = 7     # Water pouring down from above
+REGION_SIZE = 16   # The world is simulated in REGION_SIZE x REGION_SIZE columns of blocks
+
+
+def simulate_step(blocks, water):
+    """One cellular-automaton tick for a stack of regions, each with a one-block border.
+
+    blocks and water are [region, y, x, z] arrays of block types and water levels
+    (0 for none). Every cell is computed from the old state alone, so regions can be
+    stepped independently. Returns the new blocks and water for the region interiors.
+    """
+    inner = (slice(None), slice(1, -1), slice(1, -1), slice(1, -1))
+    falling = np.isin(blocks, FALLING_BLOCKS)
+    passable = (blocks == AIR) | (blocks == WATER)
+
+    # Gravity: a falling block swaps into the cell below if it can
+    new_blocks = blocks[inner].copy()
+    new_blocks[falling[inner] & passable[:, :-2, 1:-1, 1:-1]] = AIR
+    incoming = passable[inner] & falling[:, 2:, 1:-1, 1:-1]
+    new_blocks[incoming] = blocks[:, 2:, 1:-1, 1:-1][incoming]
+
+    # Water: sources stay full, water pours down at FALL_LEVEL, and water resting on
+    # something (or a source) spreads sideways losing a level per block
+    source = water == SOURCE_LEVEL
+    spreads = np.zeros_like(source)
+    spreads[:, 1:] = (water[:, 1:] > 1) & (~passable[:, :-1] | source[:, 1:])
+    side = np.where(spreads, water - 1, 0).astype(np.uint8)
+    level = np.maximum.reduce([side[:, 1:-1, :-2, 1:-1], side[:, 1:-1, 2:, 1:-1],
+                               side[:, 1:-1, 1:-1, :-2], side[:, 1:-1, 1:-1, 2:],
+                               np.where(water[:, 2:, 1:-1, 1:-1] > 0, FALL_LEVEL, 0).astype(np.uint8)])
+    level[source[inner]] = SOURCE_LEVEL
+
+    # Only open cells hold water, so a block falling into water displaces it
+    open_cells = (new_blocks == AIR) | (new_blocks == WATER)
+    level[~open_cells] = 0
+    new_blocks[open_cells] = np.where(level[open_cells] > 0, WATER, AIR)
+    return new_blocks, level
+
 
 class Player:
     """Represents the player."""
@@ -59,39 +109,135 @@ class Player:
             self.z = new_z
 
 class World:
-    """Manages the grid of blocks."""
-    def __init__(self):
-        self.grid = [[[None for _ in range(GRID_WIDTH)] for _ in range(GRID_HEIGHT)] for _ in range(10)] # 10 layers of height
-        self.generate_world()
+    """Manages the grid of blocks.
+
+    grid[y][x][z] holds block types (AIR for empty) and water[y][x][z] water levels.
+    Both are views into arrays with a border around the world, solid at the bottom
+    and sides and open at the top, which the simulation reads as neighbours.
+    """
+    def __init__(self, width=GRID_WIDTH, height=WORLD_HEIGHT, depth=GRID_HEIGHT, generate=True):
+        self.width, self.height, self.depth = width, height, depth
+        # Sized up to whole regions, plus the border
+        padded_x = -(-width // REGION_SIZE) * REGION_SIZE + 2
+        padded_z = -(-depth // REGION_SIZE) * REGION_SIZE + 2
+        self.padded_blocks = np.full((height + 2, padded_x, padded_z), STONE, np.uint8)
+        self.padded_blocks[-1] = AIR
+        self.padded_water = np.zeros_like(self.padded_blocks)
+        self.grid = self.padded_blocks[1:height + 1, 1:width + 1, 1:depth + 1]
+        self.water = self.padded_water[1:height + 1, 1:width + 1, 1:depth + 1]
+        self.grid[:] = AIR
+
+        self.active = set()         # Regions (rx, rz) to simulate next tick
+        self.dirty_columns = set()  # Columns (x, z) to redraw
+        self.tick_stats = {'regions': 0, 'changed': 0}
+        self._canvas = None
+
+        if generate:
+            self.generate_world()
 
     def generate_world(self):
         """Creates the initial landscape."""
-        for x in range(GRID_WIDTH):
-            for z in range(GRID_HEIGHT):
-                # Base layer of stone
-                self.grid[0][x][z] = Block(STONE, x, 0, z)
-                # Next layer of dirt
-                self.grid[1][x][z] = Block(DIRT, x, 1, z)
-                # Top layer of grass
-                self.grid[2][x][z] = Block(GRASS, x, 2, z)
+        # Base layer of stone
+        self.grid[0] = STONE
+        # Next layer of dirt
+        self.grid[1] = DIRT
+        # Top layer of grass
+        self.grid[2] = GRASS
+        self.activate_all()
 
+    # --- Editing ---
+    def set_block(self, x, y, z, block_type):
+        """Places a block (AIR removes one). Placed water is a source."""
+        self.grid[y, x, z] = block_type
+        self.water[y, x, z] = SOURCE_LEVEL if block_type == WATER else 0
+        self.dirty_columns.add((x, z))
+        self.activate(x // REGION_SIZE, z // REGION_SIZE)
+
+    def activate(self, rx, rz):
+        """Marks a region and its neighbours for simulation."""
+        for nx, nz in ((rx, rz), (rx - 1, rz), (rx + 1, rz), (rx, rz - 1), (rx, rz + 1)):
+            if 0 <= nx * REGION_SIZE < self.width and 0 <= nz * REGION_SIZE < self.depth:
+                self.active.add((nx, nz))
+
+    def activate_all(self):
+        self.active = {(rx, rz) for rx in range(-(-self.width // REGION_SIZE))
+                       for rz in range(-(-self.depth // REGION_SIZE))}
+        self.dirty_columns.update((x, z) for x in range(self.width) for z in range(self.depth))
+
+    # --- Simulation ---
+    def tick(self):
+        """Advances falling blocks and water by one step, in active regions only.
+
+        A region that changed stays active and wakes its neighbours; one that
+        didn't is at rest until something near it changes.
+        """
+        regions = sorted(self.active)
+        self.active = set()
+        self.tick_stats = {'regions': len(regions), 'changed': 0}
+        if not regions:
+            return
+        size = REGION_SIZE
+        slices = [(slice(rx * size, rx * size + size + 2), slice(rz * size, rz * size + size + 2)) for rx, rz in regions]
+        blocks = np.stack([self.padded_blocks[:, sx, sz] for sx, sz in slices])
+        water = np.stack([self.padded_water[:, sx, sz] for sx, sz in slices])
+        new_blocks, new_water = simulate_step(blocks, water)
+
+        inner = (slice(None), slice(1, -1), slice(1, -1), slice(1, -1))
+        block_changes = new_blocks != blocks[inner]
+        changed = block_changes | (new_water != water[inner])
+        for i in np.nonzero(changed.any(axis=(1, 2, 3)))[0]:
+            rx, rz = regions[i]
+            self.padded_blocks[1:-1, rx * size + 1:rx * size + size + 1, rz * size + 1:rz * size + size + 1] = new_blocks[i]
+            self.padded_water[1:-1, rx * size + 1:rx * size + size + 1, rz * size + 1:rz * size + size + 1] = new_water[i]
+            self.activate(rx, rz)
+            # Water levels aren't drawn, so only columns whose blocks changed need redrawing
+            for x, z in zip(*np.nonzero(block_changes[i].any(axis=0))):
+                if rx * size + x < self.width and rz * size + z < self.depth:
+                    self.dirty_columns.add((rx * size + int(x), rz * size + int(z)))
+        self.tick_stats['changed'] = int(changed.sum())
+
+    # --- Drawing ---
+    def project(self, x, y, z):
+        """Screen position of the top corner of the block at (x, y, z)."""
+        iso_x = (x - z) * (TILE_SIZE / 2) + SCREEN_WIDTH / 2
+        iso_y = (x + z) * (TILE_SIZE / 4) + SCREEN_HEIGHT / 2 - (y * TILE_SIZE / 2)
+        return iso_x, iso_y
 
     def draw_isometric(self, screen, player):
-        """Draws the world in an isometric view, centered on the player."""
-        # Sort blocks for proper rendering order (painter's algorithm)
-        blocks_to_draw = []
-        for y in range(len(self.grid)):
-            for x in range(GRID_WIDTH):
-                for z in range(GRID_HEIGHT):
-                    if self.grid[y][x][z]:
-                        blocks_to_draw.append(self.grid[y][x][z])
-        
-        blocks_to_draw.sort(key=lambda b: (b.y, b.x + b.z))
+        """Draws the world in an isometric view, centered on the player.
 
-        for block in blocks_to_draw:
-            iso_x = (block.x - block.z) * (TILE_SIZE / 2) + SCREEN_WIDTH / 2
-            iso_y = (block.x + block.z) * (TILE_SIZE / 4) + SCREEN_HEIGHT / 2 - (block.y * TILE_SIZE / 2)
-            self.draw_iso_cube(screen, iso_x, iso_y, BLOCK_COLORS[block.block_type])
+        The picture is kept between frames; only the screen area covered by
+        columns that changed since the last call is redrawn.
+        """
+        if self._canvas is None or self._canvas.get_size() != screen.get_size():
+            self._canvas = pygame.Surface(screen.get_size())
+            self.redraw(self._canvas.get_rect())
+        elif self.dirty_columns:
+            x, z = np.array(sorted(self.dirty_columns)).T
+            iso_x, top = self.project(x, self.height - 1, z)
+            bottom = self.project(x, 0, z)[1] + TILE_SIZE
+            left, right = np.floor(iso_x.min() - TILE_SIZE / 2), np.ceil(iso_x.max() + TILE_SIZE / 2)
+            top, bottom = np.floor(top.min()), np.ceil(bottom.max())
+            # Polygon edges are drawn inclusively, so allow a pixel either side
+            self.redraw(pygame.Rect(int(left) - 1, int(top) - 1, int(right - left) + 3, int(bottom - top) + 3))
+        self.dirty_columns.clear()
+        screen.blit(self._canvas, (0, 0))
+
+    def redraw(self, area):
+        """Repaints the blocks overlapping area of the canvas."""
+        canvas = self._canvas
+        canvas.set_clip(area)
+        canvas.fill(SKY_BLUE)
+        y, x, z = np.nonzero(self.grid)
+        iso_x, iso_y = self.project(x, y, z)
+        overlaps = np.nonzero((iso_x + TILE_SIZE / 2 >= area.left - 1) & (iso_x - TILE_SIZE / 2 <= area.right + 1)
+                              & (iso_y + TILE_SIZE >= area.top - 1) & (iso_y <= area.bottom + 1))[0]
+        # Sort blocks for proper rendering order (painter's algorithm)
+        order = overlaps[np.lexsort((x[overlaps] + z[overlaps], y[overlaps]))]
+        block_types = self.grid[y[order], x[order], z[order]]
+        for block_type, bx, by in zip(block_types.tolist(), iso_x[order].tolist(), iso_y[order].tolist()):
+            self.draw_iso_cube(canvas, bx, by, BLOCK_COLORS[block_type])
+        canvas.set_clip(None)
 
     def draw_iso_cube(self, screen, x, y, colors):
         """Draws a single isometric cube."""
@@ -142,6 +288,11 @@ def main():
                     player.move(-1, 0, world)
                 if event.key == pygame.K_RIGHT:
                     player.move(1, 0, world)
+                # Drop sand, gravel or a water source from the top of the world above the player
+                if event.key in DROP_KEYS:
+                    world.set_block(player.x, world.height - 1, player.z, DROP_KEYS[event.key])
+
+        world.tick()
 
         screen.fill(SKY_BLUE)
         world.draw_isometric(screen, player)
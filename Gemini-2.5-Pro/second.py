@@ -1,15 +1,18 @@
 import pygame
+import numpy as np
+import argparse
+import os
 import sys
-import random
-
-# --- Initialization ---
-pygame.init()
+import zipfile
+import zlib
+from functools import cached_property
 
 # --- Screen & Game Constants ---
 TILE_SIZE = 24  # Increased tile size for a clearer view of procedural assets
 SCREEN_WIDTH = 30 * TILE_SIZE  # 720 pixels
 SCREEN_HEIGHT = 20 * TILE_SIZE # 480 pixels
 FPS = 60
+MAP_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "map_cache")
 
 # --- Colors ---
 BLACK = (0, 0, 0)
@@ -20,11 +23,6 @@ GRASS_COLOR_LIGHT = (50, 205, 50)
 WALL_MORTAR_COLOR = (139, 69, 19)
 WALL_BRICK_COLOR = (160, 82, 45)
 
-# --- Game Setup ---
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("Procedural Top-Down RPG")
-clock = pygame.time.Clock()
-
 # --- Asset Generation Functions ---
 # These functions create pygame.Surface objects to be used as assets.
 
@@ -36,55 +34,219 @@ def create_player_asset(size):
     pygame.draw.rect(surface, (0,0,0), (size // 2 - 1, 0, 2, size)) # Simple cross shape
     return surface
 
-def create_grass_asset(size):
-    """Creates a textured grass tile."""
-    surface = pygame.Surface((size, size))
-    surface.fill(GRASS_COLOR_DARK)
-    # Add a few lighter green pixels for texture
-    for _ in range(15):
-        x = random.randint(0, size - 1)
-        y = random.randint(0, size - 1)
-        pygame.draw.rect(surface, GRASS_COLOR_LIGHT, (x, y, 1, 1))
-    return surface
+# Tile textures are generated as NumPy pixel arrays, a handful of variants per
+# tile type at once, and packed into a single sprite sheet (see TileVariants).
 
-def create_wall_asset(size):
-    """Creates a brick wall tile."""
-    surface = pygame.Surface((size, size))
-    surface.fill(WALL_MORTAR_COLOR)
+def grass_variant_pixels(size, count, rng):
+    """Returns (count, size, size, 3) uint8 pixels for grass variants."""
+    pixels = np.empty((count, size, size, 3), np.uint8)
+    pixels[:] = GRASS_COLOR_DARK
+    # About 15 lighter green pixels per tile, as in the original single texture
+    specks = rng.random((count, size, size)) < 15 / (size * size)
+    pixels[specks] = GRASS_COLOR_LIGHT
+    # A slight per-variant shade shift so neighbouring tiles don't look stamped
+    shade = rng.integers(-8, 9, (count, 1, 1, 1))
+    return np.clip(pixels.astype(np.int16) + shade, 0, 255).astype(np.uint8)
+
+def wall_variant_pixels(size, count, rng):
+    """Returns (count, size, size, 3) uint8 pixels for brick wall variants."""
     brick_width = size // 2
     brick_height = size // 4
-    for row in range(4):
-        for col in range(2):
-            x = col * brick_width
-            y = row * brick_height
-            # Add horizontal offset for alternate rows to create a classic brick pattern
-            if row % 2 == 1:
-                x += brick_width // 2
-            
-            # Draw the main part of the brick
-            pygame.draw.rect(surface, WALL_BRICK_COLOR, (x, y, brick_width - 1, brick_height - 1))
-            
-            # Handle the wrapped-around part of the offset brick
-            if row % 2 == 1 and col == 0:
-                 pygame.draw.rect(surface, WALL_BRICK_COLOR, (x - size, y, brick_width - 1, brick_height - 1))
-    return surface
+    ys, xs = np.mgrid[0:size, 0:size]
+    brick_row = ys // brick_height
+    # Alternate rows are offset by half a brick for the classic pattern
+    shifted_x = (xs - (brick_row % 2) * (brick_width // 2)) % size
+    brick_col = shifted_x // brick_width
+    mortar = (ys % brick_height == brick_height - 1) | (shifted_x % brick_width == brick_width - 1)
+
+    # Every brick in every variant gets its own shade
+    rows, cols = size // brick_height + 1, size // brick_width + 1
+    shades = rng.integers(-15, 16, (count, rows, cols))
+    brick = np.array(WALL_BRICK_COLOR, np.int16) + shades[:, brick_row, brick_col][..., None]
+    pixels = np.where(mortar[None, :, :, None], np.array(WALL_MORTAR_COLOR, np.int16), brick)
+    return np.clip(pixels, 0, 255).astype(np.uint8)
+
+TILE_VARIANT_GENERATORS = {'G': grass_variant_pixels, 'W': wall_variant_pixels}
+
+
+class TileVariants:
+    """A bounded pool of texture variants per tile type, packed into one sprite sheet.
+
+    Each tile picks its variant from a hash of its coordinates, so the map gets
+    visual variety while memory stays fixed at (tile types x variants) textures
+    no matter how large the map is.
+    """
+    def __init__(self, tile_size, count=8, seed=None):
+        self.tile_size = tile_size
+        self.count = count
+        rng = np.random.default_rng(seed)
+        self.rows = {}  # tile char -> row in the sheet
+        strips = []
+        for row, (char, generate) in enumerate(TILE_VARIANT_GENERATORS.items()):
+            self.rows[char] = row
+            # (count, size, size, 3) -> one horizontal strip of variants
+            strips.append(np.concatenate(list(generate(tile_size, count, rng)), axis=1))
+        pixels = np.concatenate(strips, axis=0)
+        # surfarray expects (width, height, 3)
+        self.sheet = pygame.surfarray.make_surface(pixels.transpose(1, 0, 2))
+
+    @property
+    def memory_bytes(self):
+        return self.sheet.get_width() * self.sheet.get_height() * self.sheet.get_bytesize()
+
+    def variant_index(self, tx, ty):
+        """Deterministically picks a variant for the tile at (tx, ty)."""
+        h = (tx * 73856093) ^ (ty * 19349663)
+        h = (h ^ (h >> 13)) * 0x5bd1e995
+        return (h ^ (h >> 15)) % self.count
+
+    def area(self, char, tx, ty):
+        """The sheet rect holding the texture for the tile at (tx, ty)."""
+        size = self.tile_size
+        return pygame.Rect(self.variant_index(tx, ty) * size, self.rows[char] * size, size, size)
+
+    def blit(self, surface, char, tx, ty, pos):
+        surface.blit(self.sheet, pos, self.area(char, tx, ty))
+
+
+# --- Collision Grid ---
+class TileGrid:
+    """A boolean solidity grid built from a tile map.
+
+    Collision queries only look at the tiles a rect overlaps, so their cost
+    does not depend on the size of the map or the number of walls. Anything
+    with a pygame.Rect (the player, future NPCs, projectiles) can use it.
+    """
+    def __init__(self, tile_map, tile_size, solid_chars="W"):
+        self.tile_size = tile_size
+        self.height = len(tile_map)
+        self.width = len(tile_map[0]) if tile_map else 0
+        # One bytearray per row: 1 = solid, 0 = walkable. translate() keeps this fast on huge maps.
+        table = bytes(1 if chr(i) in solid_chars else 0 for i in range(256))
+        self.solid = [bytearray(row, "latin-1").translate(table) for row in tile_map]
+
+    def is_solid(self, tx, ty):
+        """Returns True for solid tiles. Anything outside the map counts as solid."""
+        if 0 <= tx < self.width and 0 <= ty < self.height:
+            return self.solid[ty][tx] == 1
+        return True
+
+    def tile_rect(self, tx, ty):
+        return pygame.Rect(tx * self.tile_size, ty * self.tile_size, self.tile_size, self.tile_size)
+
+    def overlapping_tiles(self, rect):
+        """Yields (tx, ty) for every tile the rect overlaps (four at most for a tile-sized rect)."""
+        size = self.tile_size
+        left, top = rect.left // size, rect.top // size
+        right, bottom = (rect.right - 1) // size, (rect.bottom - 1) // size
+        for ty in range(top, bottom + 1):
+            for tx in range(left, right + 1):
+                yield tx, ty
 
-# --- Procedural Asset Creation ---
-player_img = create_player_asset(TILE_SIZE)
-grass_img = create_grass_asset(TILE_SIZE)
-wall_img = create_wall_asset(TILE_SIZE)
+    def solid_rects(self, rect):
+        """Returns the rects of all solid tiles overlapping the given rect."""
+        return [self.tile_rect(tx, ty) for tx, ty in self.overlapping_tiles(rect) if self.is_solid(tx, ty)]
+
+    def collides(self, rect):
+        return any(self.is_solid(tx, ty) for tx, ty in self.overlapping_tiles(rect))
+
+    def move_and_collide(self, rect, dx, dy):
+        """Moves the rect in place by (dx, dy) and pushes it out of any solid tiles.
+
+        Call once per axis (dx or dy zero) for the usual sliding behaviour.
+        """
+        rect.x += dx
+        rect.y += dy
+
+        for wall_rect in self.solid_rects(rect):
+            if rect.colliderect(wall_rect):
+                if dx > 0: rect.right = wall_rect.left
+                if dx < 0: rect.left = wall_rect.right
+                if dy > 0: rect.bottom = wall_rect.top
+                if dy < 0: rect.top = wall_rect.bottom
+        return rect
+
+
+# --- Baked Background ---
+class BakedBackground:
+    """The static map (grass plus walls) composited once into chunk surfaces.
+
+    Nothing on the map ever changes, so instead of blitting every tile each
+    frame we blit the few chunks that cover the view. Large maps are split
+    into chunks so no single surface gets enormous, and each chunk is only
+    baked the first time it comes into view.
+    """
+    def __init__(self, tile_map, tile_size, variants, chunk_tiles=32):
+        self.tile_map = tile_map
+        self.tile_size = tile_size
+        self.variants = variants
+        self.chunk_tiles = chunk_tiles
+        self.chunk_size = chunk_tiles * tile_size
+        self.map_height = len(tile_map)
+        self.map_width = len(tile_map[0]) if tile_map else 0
+        self.rect = pygame.Rect(0, 0, self.map_width * tile_size, self.map_height * tile_size)
+        self.chunks = {}  # (cx, cy) -> Surface, filled in on demand
+
+    def get_chunk(self, cx, cy):
+        chunk = self.chunks.get((cx, cy))
+        if chunk is None:
+            chunk = self.chunks[(cx, cy)] = self._bake_chunk(cx, cy)
+        return chunk
+
+    def _bake_chunk(self, cx, cy):
+        tile_size, variants = self.tile_size, self.variants
+        left, top = cx * self.chunk_tiles, cy * self.chunk_tiles
+        cols = min(self.chunk_tiles, self.map_width - left)
+        rows = min(self.chunk_tiles, self.map_height - top)
+        chunk = pygame.Surface((cols * tile_size, rows * tile_size)).convert()
+        for y in range(rows):
+            row = self.tile_map[top + y]
+            for x in range(cols):
+                tx, ty = left + x, top + y
+                pos = (x * tile_size, y * tile_size)
+                # Every tile sits on grass; walls are drawn on top of it
+                variants.blit(chunk, 'G', tx, ty, pos)
+                char = row[tx]
+                if char != 'G' and char in variants.rows:
+                    variants.blit(chunk, char, tx, ty, pos)
+        return chunk
+
+    def blit_region(self, surface, world_rect, offset=(0, 0)):
+        """Copies the background under world_rect onto surface, shifted by -offset.
+
+        Returns the number of blits performed.
+        """
+        world_rect = world_rect.clip(self.rect)
+        if not world_rect.width or not world_rect.height:
+            return 0
+        size = self.chunk_size
+        blits = 0
+        for cy in range(world_rect.top // size, (world_rect.bottom - 1) // size + 1):
+            for cx in range(world_rect.left // size, (world_rect.right - 1) // size + 1):
+                chunk_rect = pygame.Rect(cx * size, cy * size, size, size)
+                area = world_rect.clip(chunk_rect)
+                dest = (area.x - offset[0], area.y - offset[1])
+                surface.blit(self.get_chunk(cx, cy), dest, area.move(-chunk_rect.x, -chunk_rect.y))
+                blits += 1
+        return blits
+
+    def draw(self, surface, offset=(0, 0)):
+        """Draws the part of the background visible on surface. Returns the blit count."""
+        view = pygame.Rect(offset, surface.get_size())
+        return self.blit_region(surface, view, offset)
 
 
 # --- Player Class ---
 class Player(pygame.sprite.Sprite):
-    def __init__(self, x, y):
+    def __init__(self, x, y, image):
         super().__init__()
-        self.image = player_img
+        self.image = image
         self.rect = self.image.get_rect(topleft=(x, y))
         self.speed = 3
 
-    def update(self, walls):
-        keys = pygame.key.get_pressed()
+    def update(self, tile_grid, keys=None):
+        if keys is None:
+            keys = pygame.key.get_pressed()
         dx, dy = 0, 0
 
         if keys[pygame.K_LEFT] or keys[pygame.K_a]:
@@ -98,27 +260,12 @@ class Player(pygame.sprite.Sprite):
 
         # Move each axis separately for better collision handling
         if dx != 0:
-            self.move_and_collide(dx, 0, walls)
+            self.move_and_collide(dx, 0, tile_grid)
         if dy != 0:
-            self.move_and_collide(0, dy, walls)
-
-    def move_and_collide(self, dx, dy, walls):
-        self.rect.x += dx
-        self.rect.y += dy
+            self.move_and_collide(0, dy, tile_grid)
 
-        for wall in walls:
-            if self.rect.colliderect(wall.rect):
-                if dx > 0: self.rect.right = wall.rect.left
-                if dx < 0: self.rect.left = wall.rect.right
-                if dy > 0: self.rect.bottom = wall.rect.top
-                if dy < 0: self.rect.top = wall.rect.bottom
-
-# --- Tile Class ---
-class Tile(pygame.sprite.Sprite):
-    def __init__(self, x, y, image):
-        super().__init__()
-        self.image = image
-        self.rect = self.image.get_rect(topleft=(x, y))
+    def move_and_collide(self, dx, dy, tile_grid):
+        tile_grid.move_and_collide(self.rect, dx, dy)
 
 # --- Map Definition ---
 # W = Wall, G = Grass
@@ -145,50 +292,265 @@ game_map = [
     "WWWWWWWWWWWWWWWWWWWWWWWWWWWWWW",
 ]
 
-# --- Sprite Groups ---
-all_sprites = pygame.sprite.Group()
-wall_sprites = pygame.sprite.Group()
-map_sprites = pygame.sprite.Group() # For drawing background tiles
-
-# --- Create Game Objects from Map ---
-for y, row in enumerate(game_map):
-    for x, char in enumerate(row):
-        pos_x, pos_y = x * TILE_SIZE, y * TILE_SIZE
-        grass_tile = Tile(pos_x, pos_y, grass_img)
-        map_sprites.add(grass_tile)
-        if char == 'W':
-            wall_tile = Tile(pos_x, pos_y, wall_img)
-            all_sprites.add(wall_tile)
-            wall_sprites.add(wall_tile)
-
-# Create player and add to the main sprite group
-player = Player(2 * TILE_SIZE, 2 * TILE_SIZE)
-all_sprites.add(player)
-
-# --- Main Game Loop ---
-running = True
-while running:
-    # --- Event Handling ---
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-        if event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_ESCAPE:
-                running = False
-
-    # --- Updates ---
-    player.update(wall_sprites)
-
-    # --- Drawing ---
-    screen.fill(BLACK)
-    map_sprites.draw(screen) # Draw the grass background
-    all_sprites.draw(screen) # Draw walls and the player
-    
-    pygame.display.flip()
-
-    # --- Frame Rate Control ---
-    clock.tick(FPS)
-
-# --- Quit Game ---
-pygame.quit()
-sys.exit()
+
+# --- Procedural Map Generation ---
+# Caves are grown with a cellular automaton over a NumPy boolean array (True = wall).
+# Every step is a whole-array operation, so even 4096x4096 maps take about a second.
+
+def generate_cave(width, height, seed, fill=0.45, iterations=5):
+    """Generates a seeded cave map. The same arguments always produce the same map.
+
+    Only the largest connected open region is kept; smaller pockets are filled in,
+    so every floor tile is reachable from every other one.
+    """
+    rng = np.random.default_rng(seed)
+    walls = rng.random((height, width)) < fill
+    for _ in range(iterations):
+        # Count the 8 neighbours of every cell at once; outside the map counts as wall
+        padded = np.pad(walls, 1, constant_values=True).view(np.uint8)
+        neighbours = np.zeros((height, width), np.uint8)
+        for dy in range(3):
+            for dx in range(3):
+                if dy != 1 or dx != 1:
+                    neighbours += padded[dy:dy + height, dx:dx + width]
+        walls = (neighbours > 4) | (walls & (neighbours == 4))
+    walls[0, :] = walls[-1, :] = True
+    walls[:, 0] = walls[:, -1] = True
+
+    labels = label_regions(~walls)
+    if labels.max() >= 0:
+        largest = np.bincount(labels[labels >= 0]).argmax()
+        walls = labels != largest
+    return walls
+
+def label_regions(open_mask):
+    """Labels 4-connected regions of True cells. Returns an int array with -1 for False cells.
+
+    Each horizontal run of open cells gets an id, runs touching vertically are
+    merged with a vectorised union-find, and the run labels are mapped back to cells.
+    """
+    height, width = open_mask.shape
+    # A closed column on the right stops runs from wrapping onto the next row
+    padded = np.zeros((height, width + 1), bool)
+    padded[:, :width] = open_mask
+    flat = padded.ravel()
+    starts = flat & ~np.concatenate(([False], flat[:-1]))
+    run_ids = (np.cumsum(starts) - 1).reshape(height, width + 1)[:, :width]
+    run_count = int(starts.sum())
+    if run_count == 0:
+        return np.full(open_mask.shape, -1)
+
+    touching = open_mask[:-1] & open_mask[1:]
+    pairs = np.unique(run_ids[:-1][touching].astype(np.int64) * run_count + run_ids[1:][touching])
+    a, b = pairs // run_count, pairs % run_count
+
+    parent = np.arange(run_count)
+    while True:
+        root_a, root_b = parent[a], parent[b]
+        differ = root_a != root_b
+        if not differ.any():
+            break
+        root_a, root_b = root_a[differ], root_b[differ]
+        # Hook the larger root under the smaller one, then flatten the trees
+        np.minimum.at(parent, np.maximum(root_a, root_b), np.minimum(root_a, root_b))
+        while True:
+            flattened = parent[parent]
+            if np.array_equal(flattened, parent):
+                break
+            parent = flattened
+    return np.where(open_mask, parent[run_ids], -1)
+
+def is_connected(walls):
+    """Returns True if all open tiles form a single region."""
+    return label_regions(~walls).max() <= 0
+
+def walls_to_tile_map(walls):
+    """Converts a boolean wall array into the list-of-strings format used by game_map."""
+    chars = np.where(walls, ord('W'), ord('G')).astype(np.uint8)
+    return [row.tobytes().decode("ascii") for row in chars]
+
+def load_or_generate_cave(width, height, seed, fill=0.45, iterations=5, cache_dir=MAP_CACHE_DIR):
+    """Returns a generated cave as a tile map, reading it from the disk cache when possible.
+
+    Maps are cached by (seed, size, params), so a map is only ever generated once.
+    """
+    name = f"cave-s{seed}-{width}x{height}-f{fill}-i{iterations}.npz"
+    path = os.path.join(cache_dir, name)
+    if os.path.exists(path):
+        try:
+            with np.load(path) as data:
+                packed = data["walls"]
+                if packed.size != (width * height + 7) // 8:
+                    raise ValueError(f"expected {width}x{height} walls")
+                return walls_to_tile_map(np.unpackbits(packed, count=width * height).reshape(height, width).astype(bool))
+        except (OSError, EOFError, ValueError, KeyError, zipfile.BadZipFile, zlib.error) as e:
+            # A truncated or corrupt cache file is regenerated and overwritten below
+            print(f"Regenerating {path}: {e}", file=sys.stderr)
+    walls = generate_cave(width, height, seed, fill, iterations)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write to a temporary file first so a crash never leaves a half-written map behind
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez_compressed(tmp_path, walls=np.packbits(walls))
+    os.replace(tmp_path, path)
+    return walls_to_tile_map(walls)
+
+def find_open_tile(tile_map):
+    """Returns the (x, y) of the open tile closest to the centre of the map."""
+    walls = np.frombuffer("".join(tile_map).encode("ascii"), np.uint8).reshape(len(tile_map), -1) == ord('W')
+    ys, xs = np.nonzero(~walls)
+    if len(xs) == 0:
+        raise ValueError("map has no open tiles")
+    height, width = walls.shape
+    closest = np.argmin((xs - width // 2) ** 2 + (ys - height // 2) ** 2)
+    return int(xs[closest]), int(ys[closest])
+
+
+# --- Camera ---
+class Camera:
+    """Scrolls the view to keep a target centred, clamped to the edges of the map.
+
+    On maps smaller than the screen the map is simply centred instead.
+    """
+    def __init__(self, view_size, world_rect):
+        self.view_width, self.view_height = view_size
+        self.world_rect = world_rect
+        self.offset = (0, 0)
+
+    def _axis_offset(self, center, view, world):
+        if world <= view:
+            return (world - view) // 2
+        return max(0, min(center - view // 2, world - view))
+
+    def follow(self, rect):
+        self.offset = (
+            self._axis_offset(rect.centerx, self.view_width, self.world_rect.width),
+            self._axis_offset(rect.centery, self.view_height, self.world_rect.height),
+        )
+        return self.offset
+
+    def apply(self, rect):
+        """Converts a world-space rect into screen space."""
+        return rect.move(-self.offset[0], -self.offset[1])
+
+
+# --- Game ---
+class Game:
+    """Owns the window, the map and all sprites.
+
+    Nothing happens at import time: constructing a Game initialises pygame and
+    opens the window, and the assets and the baked background are only
+    generated the first time they are needed. With SDL_VIDEODRIVER=dummy a
+    Game can be built and stepped without a real display.
+    """
+    def __init__(self, tile_map=None, screen_size=(SCREEN_WIDTH, SCREEN_HEIGHT), player_start=(2, 2), seed=None):
+        pygame.init()
+        self.screen = pygame.display.set_mode(screen_size)
+        pygame.display.set_caption("Procedural Top-Down RPG")
+        self.clock = pygame.time.Clock()
+        # All procedural randomness is derived from this, so a seed reproduces the whole run
+        self.seed = seed
+
+        self.tile_map = tile_map if tile_map is not None else game_map
+        self.player = Player(player_start[0] * TILE_SIZE, player_start[1] * TILE_SIZE, self.player_img)
+        self.dynamic_sprites = pygame.sprite.Group(self.player)
+        self.camera = Camera(screen_size, pygame.Rect(0, 0, len(self.tile_map[0]) * TILE_SIZE, len(self.tile_map) * TILE_SIZE))
+
+        self.last_frame_blits = 0
+        self._drawn_offset = None  # Camera offset of the last full redraw
+        self._old_rects = {}
+
+    # --- Lazily created assets ---
+    @cached_property
+    def player_img(self):
+        return create_player_asset(TILE_SIZE)
+
+    @cached_property
+    def tile_variants(self):
+        return TileVariants(TILE_SIZE, seed=self.seed)
+
+    @cached_property
+    def tile_grid(self):
+        # Collision is answered from the map grid instead of wall sprites
+        return TileGrid(self.tile_map, TILE_SIZE)
+
+    @cached_property
+    def background(self):
+        # Grass and walls never change, so they are baked into the background once
+        return BakedBackground(self.tile_map, TILE_SIZE, self.tile_variants)
+
+    # --- Frame ---
+    def handle_events(self):
+        """Returns False when the window is closed or ESC is pressed."""
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return False
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                return False
+        return True
+
+    def update(self, keys=None):
+        self._old_rects = {sprite: sprite.rect.copy() for sprite in self.dynamic_sprites}
+        self.player.update(self.tile_grid, keys)
+        self.camera.follow(self.player.rect)
+
+    def draw(self):
+        """Draws the frame and pushes it to the display. Returns the updated screen rects."""
+        blits = 0
+        if self.camera.offset != self._drawn_offset:
+            # The view scrolled (or this is the first frame): redraw everything
+            self.screen.fill(BLACK)
+            blits += self.background.draw(self.screen, self.camera.offset)
+            for sprite in self.dynamic_sprites:
+                self.screen.blit(sprite.image, self.camera.apply(sprite.rect))
+                blits += 1
+            self._drawn_offset = self.camera.offset
+            dirty_rects = [self.screen.get_rect()]
+        else:
+            # Erase and redraw only the sprites that moved, then push just those areas
+            dirty_rects = []
+            for sprite, old_rect in self._old_rects.items():
+                if sprite.rect != old_rect:
+                    blits += self.background.blit_region(self.screen, old_rect, self.camera.offset)
+                    dirty_rects.append(self.camera.apply(old_rect.union(sprite.rect)))
+            if dirty_rects:
+                for sprite in self.dynamic_sprites:
+                    self.screen.blit(sprite.image, self.camera.apply(sprite.rect))
+                    blits += 1
+        if dirty_rects:
+            pygame.display.update(dirty_rects)
+        self.last_frame_blits = blits
+        return dirty_rects
+
+    def step(self, keys=None):
+        """Moves the player and draws the frame with no FPS cap; returns draw()'s dirty rects."""
+        self.update(keys)
+        return self.draw()
+
+    def run(self):
+        while self.handle_events():
+            self.step()
+            self.clock.tick(FPS)
+        pygame.quit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Procedural Top-Down RPG")
+    parser.add_argument("--seed", type=int, help="generate a cave map from this seed instead of the built-in map")
+    parser.add_argument("--size", type=int, nargs=2, default=(128, 128), metavar=("WIDTH", "HEIGHT"),
+                        help="size of the generated map in tiles")
+    args = parser.parse_args()
+
+    if args.seed is None:
+        game = Game()
+    else:
+        tile_map = load_or_generate_cave(args.size[0], args.size[1], args.seed)
+        try:
+            player_start = find_open_tile(tile_map)
+        except ValueError as error:
+            parser.error(f"seed {args.seed} at size {args.size[0]}x{args.size[1]}: {error}")
+        game = Game(tile_map, player_start=player_start, seed=args.seed)
+    game.run()
+    sys.exit()
+
+if __name__ == "__main__":
+    main()
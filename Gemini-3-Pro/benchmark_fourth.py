@@ -0,0 +1,396 @@
+"""Headless benchmarks for fourth.py (the OpenGL voxel game).
+
+By default no OpenGL context is needed; only the world, lighting, meshing and
+visibility code is exercised. Run from this directory:
+
+    python benchmark_fourth.py        # CPU-side benchmarks
+    python benchmark_fourth.py --gl   # also time World.draw in an offscreen EGL context
+"""
+import math
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+if "--gl" in sys.argv:
+    os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+    os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+
+import numpy as np
+import fourth
+from fourth import BLOCKS, World
+
+
+def make_gl_context(width=fourth.DISPLAY_WIDTH, height=fourth.DISPLAY_HEIGHT):
+    """Creates an offscreen OpenGL context through EGL (e.g. Mesa llvmpipe), so World.draw
+    can be timed without a window. Requires PYOPENGL_PLATFORM=egl before OpenGL is imported."""
+    import ctypes
+    from OpenGL import EGL
+    display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+    major, minor = EGL.EGLint(), EGL.EGLint()
+    if not EGL.eglInitialize(display, ctypes.pointer(major), ctypes.pointer(minor)):
+        raise RuntimeError("could not initialise EGL")
+    attributes = (EGL.EGLint * 13)(
+        EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT, EGL.EGL_RED_SIZE, 8, EGL.EGL_GREEN_SIZE, 8,
+        EGL.EGL_BLUE_SIZE, 8, EGL.EGL_DEPTH_SIZE, 24, EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT, EGL.EGL_NONE)
+    config, count = EGL.EGLConfig(), EGL.EGLint()
+    if not EGL.eglChooseConfig(display, attributes, ctypes.pointer(config), 1, ctypes.pointer(count)) or not count.value:
+        raise RuntimeError("no suitable EGL config")
+    surface = EGL.eglCreatePbufferSurface(display, config, (EGL.EGLint * 5)(EGL.EGL_WIDTH, width, EGL.EGL_HEIGHT, height, EGL.EGL_NONE))
+    EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+    context = EGL.eglCreateContext(display, config, EGL.EGL_NO_CONTEXT, None)
+    if not EGL.eglMakeCurrent(display, surface, surface, context):
+        raise RuntimeError("could not make the EGL context current")
+
+    fourth.glViewport(0, 0, width, height)
+    fourth.glEnable(fourth.GL_DEPTH_TEST)
+    fourth.glEnable(fourth.GL_CULL_FACE)
+    fourth.glMatrixMode(fourth.GL_PROJECTION)
+    fourth.gluPerspective(fourth.FOV, width / height, fourth.NEAR_CLIP, fourth.FAR_CLIP)
+    fourth.glMatrixMode(fourth.GL_MODELVIEW)
+    texture_mgr = fourth.TextureManager()
+    for name, color in (('grass', fourth.GRASS_COLOR), ('dirt', fourth.DIRT_COLOR),
+                        ('stone', fourth.STONE_COLOR), ('glowstone', fourth.GLOWSTONE_COLOR)):
+        texture_mgr.generate_texture(name, color)
+    return texture_mgr
+
+
+def surface_height(world, x, z, top=0, bottom=-256):
+    """The y of the highest block in the column at (x, z)."""
+    for y in range(top, bottom, -1):
+        if world.get_block((x, y, z)):
+            return y
+    return bottom
+
+
+def benchmark_relight(size=64, depth=32, edits=200, seed=0):
+    """Times single-block edits, which relight incrementally, against a full relight."""
+    world = World()
+    world.generate_terrain(seed, size, depth)
+    half = size // 2
+    heights = {(x, z): surface_height(world, x, z) for x in range(-half, half) for z in range(-half, half)}
+    start = time.perf_counter()
+    world.compute_lighting()
+    full_ms = (time.perf_counter() - start) * 1000
+    print(f"relight {size}x{depth}x{size}: full relight {full_ms:.1f} ms")
+
+    rng = random.Random(seed)
+    cases = {
+        # On the ground only the voxel itself goes dark
+        "place on surface": lambda x, z: world.add_block((x, heights[x, z] + 1, z), 'stone'),
+        # A floating block casts a shadow that the sides have to fill back in
+        "place floating block": lambda x, z: world.add_block((x, heights[x, z] + 4, z), 'stone'),
+        "dig surface": lambda x, z: world.remove_block((x, heights[x, z], z)),
+        "place glowstone": lambda x, z: world.add_block((x, heights[x, z] + 1, z), 'glowstone'),
+        "remove glowstone": lambda x, z: world.remove_block((x, heights[x, z] + 1, z)),
+    }
+    positions = [(rng.randrange(2 - half, half - 2), rng.randrange(2 - half, half - 2)) for _ in range(edits)]
+    for name, edit in cases.items():
+        timings = []
+        for x, z in positions:
+            start = time.perf_counter()
+            edit(x, z)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        print(f"  {name}: median {timings[len(timings) // 2] * 1000:.2f} ms, "
+              f"p95 {timings[int(len(timings) * 0.95)] * 1000:.2f} ms")
+
+
+def check_relight(size=64, depth=32, edits=300, seeds=(0, 1, 2)):
+    """Checks that random single-block edits, relit incrementally, leave the same light as
+    a full relight. Edits reach above and below the terrain, into chunks that don't exist yet."""
+    for seed in seeds:
+        world = World()
+        world.generate_terrain(seed, size, depth)
+        rng = random.Random(seed)
+        half = size // 2
+        for _ in range(edits):
+            pos = (rng.randrange(-half, half), rng.randrange(-depth - 2, 24), rng.randrange(-half, half))
+            if rng.random() < 0.5:
+                world.add_block(pos, rng.choice(('stone', 'stone', 'glowstone')))
+            else:
+                world.remove_block(pos)
+        layers = (fourth.SKY_LIGHT, fourth.BLOCK_LIGHT)
+        incremental = {key: [chunk.arrays[layer].copy() for layer in layers] for key, chunk in world.chunks.items()}
+        world.compute_lighting()
+        differ = sum(int(np.count_nonzero(before != world.chunks[key].arrays[layer]))
+                     for key, arrays in incremental.items() for layer, before in zip(layers, arrays))
+        print(f"relight check seed {seed}: {differ} voxels differ from a full relight after {edits} edits")
+        assert differ == 0
+
+
+def benchmark_meshing(size=64, depth=32, seed=0):
+    """Times building lit, ambient-occluded meshes for every chunk."""
+    world = World()
+    world.generate_terrain(seed, size, depth)
+    start = time.perf_counter()
+    quads = 0
+    for chunk in world.chunks.values():
+        vertex_data, _ = world.build_mesh(chunk)
+        quads += len(vertex_data) // 4
+    elapsed = time.perf_counter() - start
+    print(f"meshing {len(world.chunks)} chunks: {elapsed * 1000 / len(world.chunks):.2f} ms/chunk, {quads} quads")
+
+
+def benchmark_culling(seed=0, texture_mgr=None, frames=20):
+    """Compares drawing every chunk with drawing only the chunks cave culling keeps,
+    from a few camera positions on a deep world. Frame times need texture_mgr (a GL context)."""
+    world = World(seed)
+    meshes = {chunk.key: world.chunk_mesh(chunk) for chunk in world.chunks.values()}
+    total_quads = sum(len(vertex_data) for vertex_data, _ in meshes.values()) // 4
+    cameras = {"above ground": (0, 4, 0), "on the surface": (5, -6, 5), "in a cave": None, "deep underground": (-20, -54, 12)}
+    # Put the cave camera in the first air voxel found well below the surface
+    for chunk in world.chunks.values():
+        if chunk.key[1] == -3:
+            air = np.argwhere(chunk.arrays[BLOCKS] == 0)
+            if len(air):
+                cameras["in a cave"] = tuple(int(o + a) for o, a in zip(chunk.origin, air[len(air) // 2]))
+                break
+
+    start = time.perf_counter()
+    for chunk in world.chunks.values():
+        chunk.face_connectivity()
+    connectivity_ms = (time.perf_counter() - start) * 1000 / len(world.chunks)
+
+    print(f"culling on {len(world.chunks)} chunks, {total_quads} quads "
+          f"(face connectivity {connectivity_ms:.2f} ms/chunk after an edit):")
+    for name, pos in cameras.items():
+        if pos is None:
+            continue
+        start = time.perf_counter()
+        visible = world.visible_chunks(pos)
+        bfs_ms = (time.perf_counter() - start) * 1000
+        quads = sum(len(meshes[chunk.key][0]) for chunk in visible) // 4
+        line = (f"  {name}: {len(visible)} chunks drawn, {len(world.chunks) - len(visible)} culled, "
+                f"{quads}/{total_quads} quads, visibility walk {bfs_ms:.2f} ms")
+        if texture_mgr is not None:
+            timings = {}
+            for label, camera in (("all", None), ("culled", pos)):
+                fourth.glClear(fourth.GL_COLOR_BUFFER_BIT | fourth.GL_DEPTH_BUFFER_BIT)
+                fourth.glLoadIdentity()
+                fourth.glTranslatef(-pos[0], -pos[1], -pos[2])
+                start = time.perf_counter()
+                for _ in range(frames):
+                    world.draw(texture_mgr, camera, lod_distances=())
+                fourth.glFinish()
+                timings[label] = (time.perf_counter() - start) / frames * 1000
+            line += f", frame {timings['all']:.2f} -> {timings['culled']:.2f} ms"
+        print(line)
+
+
+def benchmark_lod(seed=0, texture_mgr=None, frames=20):
+    """Compares vertex counts (and, with texture_mgr, frame times) of full detail at the
+    old 50 block view distance against level of detail out to FAR_CLIP."""
+    world = World(seed)
+    for scale in fourth.LOD_SCALES:
+        start = time.perf_counter()
+        for chunk in world.chunks.values():
+            world.chunk_mesh(chunk, scale)
+        build_ms = (time.perf_counter() - start) * 1000 / len(world.chunks)
+        print(f"lod meshing at {scale}x: {build_ms:.2f} ms/chunk")
+
+    camera = (0, 4, 0)
+    settings = {
+        "full detail, view 50": (50, ()),
+        f"full detail, view {fourth.FAR_CLIP:.0f}": (fourth.FAR_CLIP, ()),
+        f"lod, view {fourth.FAR_CLIP:.0f}": (fourth.FAR_CLIP, fourth.LOD_DISTANCES),
+    }
+    for name, (view_distance, lod_distances) in settings.items():
+        selected = world.meshes_to_draw(camera, view_distance, lod_distances)
+        vertices = sum(len(vertex_data) for _, _, (vertex_data, _) in selected)
+        scales = {}
+        for _, scale, _ in selected:
+            scales[scale] = scales.get(scale, 0) + 1
+        line = f"  {name}: {len(selected)} chunks {dict(sorted(scales.items()))}, {vertices} vertices"
+        if texture_mgr is not None:
+            fourth.glClear(fourth.GL_COLOR_BUFFER_BIT | fourth.GL_DEPTH_BUFFER_BIT)
+            fourth.glLoadIdentity()
+            fourth.glTranslatef(-camera[0], -camera[1], -camera[2])
+            start = time.perf_counter()
+            for _ in range(frames):
+                world.draw(texture_mgr, camera, view_distance, lod_distances)
+            fourth.glFinish()
+            line += f", frame {(time.perf_counter() - start) / frames * 1000:.2f} ms"
+        print(line)
+
+    # An edit only rebuilds the one scale each touched chunk is drawn at
+    pos = (3, surface_height(world, 3, 3) + 1, 3)
+    world.add_block(pos, 'stone')
+    start = time.perf_counter()
+    world.meshes_to_draw(camera)
+    print(f"  redraw after an edit: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+
+def benchmark_bulk_edits(seed=0, size=100, single_edits=2000):
+    """Times region operations of about a million blocks (including relighting and
+    recording undo data) against placing blocks one add_block call at a time."""
+    world = World(seed)
+    # A floor of blocks hanging over the terrain, each one shading the column below it
+    start = time.perf_counter()
+    for i in range(single_edits):
+        world.add_block((i % 40 - 20, 10 + i // 1600, (i // 40) % 40 - 20), 'stone')
+    single_rate = single_edits / (time.perf_counter() - start)
+    print(f"bulk edits: add_block one at a time {single_rate:,.0f} blocks/s")
+
+    lo = (-size // 2, -40, -size // 2)
+    hi = (lo[0] + size - 1, lo[1] + size - 1, lo[2] + size - 1)
+    radius = int((3 * size ** 3 / (4 * math.pi)) ** (1 / 3))
+    clipboard = world.copy(lo, hi)
+    operations = {
+        f"fill {size}^3": lambda: world.fill_box(lo, hi, 'stone'),
+        f"hollow {size}^3": lambda: world.hollow_box(lo, hi, 'dirt'),
+        f"replace {size}^3": lambda: world.replace(lo, hi, 'dirt', 'glowstone'),
+        f"sphere r={radius}": lambda: world.sphere((0, 10, 0), radius, None),
+        f"paste {size}^3": lambda: world.paste(lo, clipboard),
+        "undo": world.undo,
+        "redo": world.redo,
+    }
+    for name, operation in operations.items():
+        start = time.perf_counter()
+        edit = operation()
+        elapsed = time.perf_counter() - start
+        dirty = sum(chunk.dirty for chunk in world.chunks.values())
+        for chunk in world.chunks.values():
+            chunk.dirty = False
+        print(f"  {name}: {edit.blocks:,} blocks in {elapsed * 1000:.0f} ms ({edit.blocks / elapsed:,.0f} blocks/s), "
+              f"{len(edit.diffs)} chunks, undo data {edit.nbytes / 1024:.1f} KiB, {dirty} meshes dirtied")
+
+
+def benchmark_network(client_counts=(1, 8, 32, 64), seconds=3, seed=0):
+    """Runs world_server over localhost with simulated clients.
+
+    One observer mirrors the world (relighting and remeshing like a real client);
+    the others walk around, send edits and only count what they receive. Reports
+    the observer's initial download, steady-state bandwidth per client, the time
+    from a client sending an edit to the observer having it meshed, and server tick
+    times against the tick budget. Everything shares one process, so with many
+    clients the bots and the observer also slow down how often the server ticks.
+    """
+    import asyncio
+    import world_server
+    from world_server import WorldClient, WorldServer
+
+    async def run(count):
+        server = WorldServer(World(seed))
+        port = await server.start('127.0.0.1', 0)
+        observer = WorldClient()
+        await observer.connect('127.0.0.1', port)
+        tasks = [asyncio.create_task(observer.receive())]
+
+        # Initial download: until the observer has every column in its view distance
+        start = time.perf_counter()
+        observer.send_position((0, 4, 0))
+        radius = server.view_distance // fourth.CHUNK_SIZE
+        in_view = sum(1 for cx in range(-radius, radius + 1) for cz in range(-radius, radius + 1) if cx * cx + cz * cz <= radius * radius)
+        connection = next(iter(server.connections))
+        while len(connection.columns) < in_view or server.pending or observer.inbox:
+            await asyncio.sleep(0.01)
+            observer.apply_pending()
+        download_s = time.perf_counter() - start
+        download_bytes = observer.bytes_received
+
+        sent_at = {}   # pos -> time the edit was sent
+        latencies = []
+        rng = random.Random(count)
+
+        async def bot(index):
+            client = WorldClient(mirror=False)
+            await client.connect('127.0.0.1', port)
+            tasks.append(asyncio.create_task(client.receive()))
+            x, z = rng.uniform(-60, 60), rng.uniform(-60, 60)
+            while True:
+                x, z = x + rng.uniform(-1, 1), z + rng.uniform(-1, 1)
+                client.send_position((x, 0, z))
+                # Bots build and dig just above the ground in the observer's view
+                pos = (rng.randrange(-24, 24), rng.randrange(-4, 2), rng.randrange(-24, 24))
+                sent_at[pos] = time.perf_counter()
+                client.send_edits({pos: rng.choice((0, fourth.BLOCK_IDS['stone']))})
+                await asyncio.sleep(0.1)
+
+        async def watch():
+            while True:
+                await observer.received.wait()
+                observer.received.clear()
+                applied = observer.apply_pending()
+                for chunk in observer.world.chunks.values():
+                    if chunk.dirty:
+                        observer.world.chunk_mesh(chunk)
+                now = time.perf_counter()
+                latencies.extend(now - sent_at.pop(pos) for pos in applied if pos in sent_at)
+
+        tasks.append(asyncio.create_task(watch()))
+        tasks.extend(asyncio.create_task(bot(i)) for i in range(count))
+        # Let the bots download their surroundings before measuring the steady state
+        while any(len(c.columns) < in_view for c in server.connections):
+            await asyncio.sleep(0.1)
+        server.tick_times.clear()
+        sent_before = {c: c.bytes_sent for c in server.connections}
+        latencies.clear()
+        await asyncio.sleep(seconds)
+        per_client = [(c.bytes_sent - sent_before.get(c, 0)) / seconds for c in server.connections]
+        ticks = sorted(server.tick_times)
+
+        for task in tasks:
+            task.cancel()
+        await server.stop()
+        latencies.sort()
+        budget_ms = server.tick_interval * 1000
+        print(f"  {count} clients: {sum(per_client) / len(per_client) / 1024:.1f} KiB/s per client, "
+              f"edit to visible p50 {latencies[len(latencies) // 2] * 1000:.0f} ms "
+              f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.0f} ms ({len(latencies)} edits), "
+              f"tick p50 {ticks[len(ticks) // 2] * 1000:.1f} ms max {ticks[-1] * 1000:.1f} ms of {budget_ms:.0f} ms, "
+              f"{len(ticks) / seconds:.0f} ticks/s")
+        return download_s, download_bytes
+
+    print(f"network (view distance {world_server.VIEW_DISTANCE}, {world_server.TICK_RATE} ticks/s):")
+    for count in client_counts:
+        download_s, download_bytes = asyncio.run(run(count))
+    print(f"  initial download: {download_bytes / 1024:.0f} KiB in {download_s:.2f} s")
+
+
+def regression_cases(seed=0):
+    """Yields timed cases for ../benchmark_regression.py: block-picking rays of three
+    lengths and, given --gl and an OpenGL context, texture generation and drawing
+    terrain of three sizes."""
+    texture_mgr = None
+    if "--gl" in sys.argv:
+        try:
+            texture_mgr = make_gl_context()
+        except Exception as error:
+            print(f"no OpenGL context, skipping its cases: {error}", file=sys.stderr)
+    if texture_mgr is not None:
+        yield "TextureManager.generate_texture", lambda: texture_mgr.generate_texture('grass', fourth.GRASS_COLOR)
+
+    world = World()
+    world.generate_terrain(seed, 64, 32)
+    player = fourth.Player()
+    player.pos = [0.5, 8.5, 0.5]  # Above the hills, looking level, so rays run their full length
+    for distance in (5, 30, 100):
+        yield f"raycast distance={distance}", lambda distance=distance: fourth.raycast(player, world, distance)
+
+    if texture_mgr is not None:
+        for size in (32, 64, 128):
+            world = World()
+            world.generate_terrain(seed, size, 32)
+            camera = (0, 8, 0)
+
+            def draw(world=world, camera=camera):
+                fourth.glClear(fourth.GL_COLOR_BUFFER_BIT | fourth.GL_DEPTH_BUFFER_BIT)
+                fourth.glLoadIdentity()
+                fourth.glTranslatef(-camera[0], -camera[1], -camera[2])
+                world.draw(texture_mgr, camera)
+                fourth.glFinish()
+            yield f"World.draw terrain={size}", draw
+
+
+if __name__ == "__main__":
+    texture_mgr = make_gl_context() if "--gl" in sys.argv else None
+    check_relight()
+    benchmark_relight()
+    benchmark_meshing()
+    benchmark_culling(texture_mgr=texture_mgr)
+    benchmark_lod(texture_mgr=texture_mgr)
+    benchmark_bulk_edits()
+    benchmark_network()
+    sys.exit()
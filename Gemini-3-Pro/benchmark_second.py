@@ -0,0 +1,172 @@
+"""Headless benchmarks for second.py, the RPG with enemies, fog of war and rewind.
+
+Run from this directory:  python benchmark_second.py
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import pygame
+from benchmark_common import HeldKeys, random_walls
+from second import SIGHT_RADIUS, FieldOfView, Game
+
+
+def make_map(width, height, enemies, wall_chance=0.05, seed=0):
+    """A map in GAME_MAP's format ('#' walls, 'E' enemies, 'P' the player, in the middle)
+    with the given number of enemies on random open tiles."""
+    rng = random.Random(seed)
+    tiles = [['#' if wall else '.' for wall in row] for row in random_walls(width, height, wall_chance, rng)]
+    open_tiles = [(x, y) for y, row in enumerate(tiles) for x, char in enumerate(row) if char == '.']
+    player = (width // 2, height // 2)
+    for x, y in rng.sample(open_tiles, enemies):
+        tiles[y][x] = 'E'
+    tiles[player[1]][player[0]] = 'P'
+    return [''.join(row) for row in tiles]
+
+
+def benchmark_ai(counts=(100, 1000, 10000, 50000), tiles_per_enemy=50, frames=300):
+    """Times the update pass with every enemy updating each frame against the tiered scheduler.
+
+    The map grows with the enemy count, so the density around the player stays the same.
+    """
+    walking = [HeldKeys(pygame.K_RIGHT), HeldKeys(pygame.K_DOWN), HeldKeys(pygame.K_LEFT), HeldKeys(pygame.K_UP)]
+    for count in counts:
+        side = int((count * tiles_per_enemy) ** 0.5)
+        tile_map = make_map(side, side, count, seed=count)
+
+        # What the game loop used to do: every enemy, every frame
+        game = Game(tile_map)
+        game.player.health = game.player.max_health = 10**9  # Nothing gets to end the run
+        start = time.perf_counter()
+        for i in range(frames):
+            game.player.update(walking[(i // 60) % 4])
+            for enemy in game.enemies_group.sprites():
+                enemy.update()
+        every_ms = (time.perf_counter() - start) / frames * 1000
+
+        game = Game(tile_map)
+        game.player.health = game.player.max_health = 10**9
+        update_times, frame_times = [], []
+        for i in range(frames):
+            start = time.perf_counter()
+            game.update(walking[(i // 60) % 4])
+            update_times.append(time.perf_counter() - start)
+            game.draw()
+            frame_times.append(time.perf_counter() - start)
+        update_times.sort()
+        frame_times.sort()
+
+        stats = game.ai.stats
+        print(f"ai {count} enemies on {side}x{side}: every enemy {every_ms:.2f} ms/frame, "
+              f"scheduled p50 {update_times[frames // 2] * 1000:.2f} ms max {update_times[-1] * 1000:.2f} ms, "
+              f"whole frame p50 {frame_times[frames // 2] * 1000:.2f} ms "
+              f"(near {stats['near']}, mid {stats['mid']}/frame of {stats['awake']} awake)")
+
+def benchmark_fov(sizes=(256, 1024, 4096), radii=(8, SIGHT_RADIUS, 16, 32), samples=2000, seed=0):
+    """Shadowcasting computations/s on large random maps, and how often a walk hits the cache."""
+    for size in sizes:
+        tile_map = make_map(size, size, 0, wall_chance=0.1, seed=seed)
+        rng = random.Random(seed)
+        tiles = [(rng.randrange(1, size - 1), rng.randrange(1, size - 1)) for _ in range(samples)]
+        rates = []
+        for radius in radii:
+            fov = FieldOfView(tile_map)
+            start = time.perf_counter()
+            visible = sum(len(fov.compute(tile, radius)) for tile in tiles)
+            rates.append(f"r{radius} {samples / (time.perf_counter() - start):.0f}/s ({visible / samples:.0f} tiles)")
+
+        # A player pacing back and forth revisits tiles, which the cache answers without recomputing
+        fov = FieldOfView(tile_map)
+        path = [(size // 2 + (step % 80 if step % 160 < 80 else 80 - step % 80), size // 2) for step in range(samples)]
+        start = time.perf_counter()
+        for tile in path:
+            fov.visible_from(tile, SIGHT_RADIUS)
+        walk_s = time.perf_counter() - start
+        print(f"fov {size}x{size}: " + ", ".join(rates)
+              + f"; walk of {samples} tiles: {fov.computed} computed, {samples / walk_s:.0f} tiles/s")
+
+def benchmark_snapshots(counts=(1000, 5000, 20000), tiles_per_enemy=20, repeats=50):
+    """Times taking and restoring snapshots, and how long save() holds up the loop."""
+    with tempfile.TemporaryDirectory() as save_dir:
+        path = os.path.join(save_dir, "save.bin")
+        for count in counts:
+            side = int((count * tiles_per_enemy) ** 0.5)
+            game = Game(make_map(side, side, count, seed=count))
+            game.player.health = game.player.max_health = 10**9
+
+            start = time.perf_counter()
+            for _ in range(repeats):
+                data = game.snapshot()
+            snapshot_ms = (time.perf_counter() - start) / repeats * 1000
+
+            # Restore back and forth between two points a second of play apart
+            walking = HeldKeys(pygame.K_RIGHT, pygame.K_DOWN)
+            for _ in range(60):
+                game.update(walking)
+            later = game.snapshot()
+            start = time.perf_counter()
+            for i in range(repeats):
+                game.restore(data if i % 2 == 0 else later)
+            restore_ms = (time.perf_counter() - start) / repeats * 1000
+
+            start = time.perf_counter()
+            game.save(path)
+            save_call_ms = (time.perf_counter() - start) * 1000
+            game.wait_for_save()
+            save_total_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            game.load(path)
+            load_ms = (time.perf_counter() - start) * 1000
+
+            print(f"snapshot {count} enemies: take {snapshot_ms:.2f} ms, restore {restore_ms:.2f} ms, "
+                  f"{len(data) / 1024:.0f} KiB; save blocks the loop {save_call_ms:.2f} ms "
+                  f"(written after {save_total_ms:.2f} ms, {os.path.getsize(path) / 1024:.0f} KiB), load {load_ms:.2f} ms")
+
+
+def regression_cases(tiles_per_enemy=50):
+    """Yields the RPG's timed cases for ../benchmark_regression.py: a frame of scheduled AI
+    and a camera draw as enemy counts grow, wall collision on small to huge maps, and
+    shadowcasting at two sight radii. Each Game is built only when its cases come up."""
+    walking = [HeldKeys(pygame.K_RIGHT), HeldKeys(pygame.K_DOWN), HeldKeys(pygame.K_LEFT), HeldKeys(pygame.K_UP)]
+    for count in (100, 1000, 10000):
+        side = int((count * tiles_per_enemy) ** 0.5)
+        game = Game(make_map(side, side, count, seed=count))
+        game.player.health = game.player.max_health = 10**9
+
+        def update(game=game, start=game.snapshot(), frames=iter(range(10**9))):
+            frame = next(frames) % 240
+            if frame == 0:
+                game.restore(start)  # Walk the same loop from the same state, so every repeat sees the same work
+            game.update(walking[frame // 60])
+        yield f"Game.update enemies={count}", update
+        yield f"CameraGroup.custom_draw enemies={count}", lambda game=game: game.camera_group.custom_draw(game.player)
+
+    for side in (32, 256, 1024):
+        player = Game(make_map(side, side, 0, wall_chance=0.2, seed=side)).player
+
+        def collide(player=player):
+            player.rect.x += player.speed
+            player.collision('x')
+            player.rect.x -= player.speed
+            player.collision('x')
+        yield f"Player.collision map={side}x{side}", collide
+
+    fov = FieldOfView(make_map(1024, 1024, 0, wall_chance=0.1))
+    tiles = iter(range(10**9))
+    for radius in (SIGHT_RADIUS, 32):
+        yield f"FieldOfView.compute radius={radius}", lambda radius=radius: fov.compute((512 + next(tiles) % 64, 512), radius)
+
+
+if __name__ == "__main__":
+    benchmark_ai()
+    benchmark_fov()
+    benchmark_snapshots()
+    pygame.quit()
+    sys.exit()
@@ -2,22 +2,32 @@ import pygame
 from pygame.locals import *
 from OpenGL.GL import *
 from OpenGL.GLU import *
+import argparse
+import bisect
+import itertools
 import math
 import random
+import zlib
+from collections import deque
+import numpy as np
 
 # --- Constants ---
 DISPLAY_WIDTH = 800
 DISPLAY_HEIGHT = 600
 FOV = 70    # Field of View
 NEAR_CLIP = 0.1
-FAR_CLIP = 50.0
+FAR_CLIP = 256.0   # View distance; far chunks are drawn with coarser meshes (see LOD_DISTANCES)
 LOOK_SPEED = 0.15
 MOVE_SPEED = 0.3
+BRUSH_RADIUS = 4   # Sphere size for the F/G bulk-edit keys
+UNDO_LIMIT = 100   # Most bulk edits kept for undo
+UNDO_BUDGET = 64 << 20   # Most bytes of compressed undo data kept; the oldest edits go first
 
 # Colors for procedural generation
 GRASS_COLOR = (34, 139, 34)
 DIRT_COLOR = (139, 69, 19)
 STONE_COLOR = (105, 105, 105)
+GLOWSTONE_COLOR = (240, 200, 110)
 
 class TextureManager:
     """Generates textures programmatically so no external files are needed."""
@@ -62,66 +72,843 @@ VERTICES = [
     ( 0.5, -0.5,  0.5), ( 0.5,  0.5,  0.5), (-0.5,  0.5,  0.5), (-0.5, -0.5,  0.5), # Front
 ]
 
-# Indices defining the 6 faces (quads)
+# Indices defining the 6 faces (quads), counter-clockwise when seen from outside
+# so that GL_CULL_FACE removes the far side of each block
 FACES = [
-    (0,1,2,3), # Back
-    (4,7,6,5), # Front
-    (0,4,5,1), # Right
-    (1,5,6,2), # Top
-    (2,6,7,3), # Left
-    (4,0,3,7)  # Bottom
+    (3,2,1,0), # Back
+    (5,6,7,4), # Front
+    (1,5,4,0), # Right
+    (2,6,5,1), # Top
+    (3,7,6,2), # Left
+    (7,3,0,4)  # Bottom
 ]
 
+# Outward normal of each face, in the same order as FACES
+FACE_NORMALS = [
+    (0, 0, -1), # Back
+    (0, 0, 1),  # Front
+    (1, 0, 0),  # Right
+    (0, 1, 0),  # Top
+    (-1, 0, 0), # Left
+    (0, -1, 0)  # Bottom
+]
+
+# Fixed per-direction shading so faces of the same block are distinguishable
+FACE_SHADE = [0.8, 0.8, 0.7, 1.0, 0.7, 0.55]
+
 # Texture Coordinates for mapping the image to the face
 TEX_COORDS = [
     (0, 0), (1, 0), (1, 1), (0, 1)
 ]
 
+# --- Blocks ---
+# Block ids as stored in chunk arrays. 0 is air; everything else is opaque.
+BLOCK_NAMES = [None, 'grass', 'dirt', 'stone', 'glowstone']
+BLOCK_IDS = {name: block_id for block_id, name in enumerate(BLOCK_NAMES) if name}
+# Light emitted by a block type (0-15)
+BLOCK_EMISSION = {BLOCK_IDS['glowstone']: 15}
+
+# --- Chunks & Lighting ---
+CHUNK_SHIFT = 4
+CHUNK_SIZE = 1 << CHUNK_SHIFT   # 16x16x16 blocks per chunk
+CHUNK_MASK = CHUNK_SIZE - 1
+CHUNK_VOLUME = CHUNK_SIZE ** 3
+MAX_LIGHT = 15
+
+# Data layers stored per chunk, and what a missing chunk reads as (air in open sunlight)
+BLOCKS, SKY_LIGHT, BLOCK_LIGHT = 0, 1, 2
+LAYER_DEFAULTS = (0, MAX_LIGHT, 0)
+
+NEIGHBOURS = [(1, 0, 0), (-1, 0, 0), (0, 1, 0), (0, -1, 0), (0, 0, 1), (0, 0, -1)]
+
+# Index of the face pointing the opposite way, and a visibility mask where every face sees every other
+OPPOSITE_FACE = [FACE_NORMALS.index(tuple(-c for c in normal)) for normal in FACE_NORMALS]
+ALL_FACES = (1 << len(FACE_NORMALS)) - 1
+
+# Light level -> brightness, and ambient occlusion (0 = fully occluded corner) -> brightness
+LIGHT_CURVE = np.array([max(0.06, 0.8 ** (MAX_LIGHT - level)) for level in range(MAX_LIGHT + 1)], np.float32)
+AO_CURVE = np.array([0.45, 0.65, 0.82, 1.0], np.float32)
+
+# --- Level of detail ---
+# Far chunks are meshed with scale^3 voxels merged into one cell. A chunk switches to
+# the next coarser scale when its centre is further than each distance from the camera.
+LOD_SCALES = (1, 2, 4, 8)
+LOD_DISTANCES = (40, 80, 160)
+
+
+def chunk_key(x, y, z):
+    return (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT, z >> CHUNK_SHIFT)
+
+def local_index(x, y, z):
+    """Index into a chunk's flat arrays, laid out as [x][y][z]."""
+    return ((x & CHUNK_MASK) << (2 * CHUNK_SHIFT)) | ((y & CHUNK_MASK) << CHUNK_SHIFT) | (z & CHUNK_MASK)
+
+def downsample(blocks, light, scale):
+    """Merges a chunk's voxels into scale^3 cells for a coarse mesh.
+
+    Takes the chunk plus a one-voxel border (as read by World.build_mesh) and returns
+    (solid, blocks, light) for the cells plus a one-cell border. A cell inside the chunk
+    is solid if any of its voxels is, so the coarse shape always contains the real one.
+    A border cell is only solid if every voxel it covers next to the chunk is, so a
+    side is closed off whenever any real air touches it. The mesh then depends on the
+    neighbours' voxels, not on the scale they are drawn at, and no cracks open up
+    where chunks of different scales meet.
+    """
+    n = CHUNK_SIZE
+    edges = np.r_[0, np.arange(1, n + 1, scale), n + 1]
+    def reduce(ufunc, array):
+        for axis in range(3):
+            array = ufunc.reduceat(array, edges, axis=axis)
+        return array
+    filled = (blocks != 0).view(np.uint8)
+    solid = reduce(np.minimum, filled).astype(bool)
+    solid[1:-1, 1:-1, 1:-1] = reduce(np.maximum, filled)[1:-1, 1:-1, 1:-1]
+
+    # Each cell shows the block at its highest solid voxel, so hills keep their grass
+    cells = n // scale
+    inner = blocks[1:-1, 1:-1, 1:-1]
+    height_first = np.where(inner != 0, (np.arange(n, dtype=np.uint16)[None, :, None] << 8) | inner, 0)
+    merged = np.zeros(solid.shape, np.uint8)
+    merged[1:-1, 1:-1, 1:-1] = height_first.reshape(cells, scale, cells, scale, cells, scale).max(axis=(1, 3, 5)) & 0xFF
+    return solid, merged, reduce(np.maximum, light)
+
+
+class Chunk:
+    """A 16x16x16 block of the world.
+
+    Each layer (block ids, sunlight, block light) is a bytearray of one byte per
+    voxel. The lighting code indexes the bytearrays directly, which is the fast
+    path for single-voxel access in Python, while `arrays` exposes the same
+    memory as NumPy [x, y, z] views for whole-chunk work like meshing.
+    """
+    def __init__(self, key):
+        self.key = key
+        self.data = tuple(bytearray([default]) * CHUNK_VOLUME for default in LAYER_DEFAULTS)
+        self.arrays = tuple(np.frombuffer(layer, np.uint8).reshape((CHUNK_SIZE,) * 3) for layer in self.data)
+        self.dirty = True   # Meshes need rebuilding
+        self.meshes = {}    # LOD scale -> (vertex_data, ranges), see World.build_mesh
+        self.visibility = None  # Face connectivity, recomputed lazily after block changes
+
+    @property
+    def origin(self):
+        return tuple(c << CHUNK_SHIFT for c in self.key)
+
+    def face_connectivity(self):
+        """Returns, for each face (in FACE_NORMALS order), a bitmask of the faces it
+        can see through the chunk's air.
+
+        The air is split into connected pockets; two faces see each other when some
+        pocket touches both. Cached until the chunk's blocks change.
+        """
+        if self.visibility is not None:
+            return self.visibility
+        air = self.arrays[BLOCKS] == 0
+        if air.all():
+            self.visibility = [ALL_FACES] * 6
+            return self.visibility
+        if not air.any():
+            self.visibility = [0] * 6
+            return self.visibility
+
+        # Label the air pockets by repeatedly taking the smallest label among neighbours
+        blocked = CHUNK_VOLUME
+        labels = np.where(air, np.arange(CHUNK_VOLUME).reshape(air.shape), blocked)
+        while True:
+            spread = labels.copy()
+            for axis in range(3):
+                forward = [slice(None)] * 3
+                backward = [slice(None)] * 3
+                forward[axis], backward[axis] = slice(1, None), slice(None, -1)
+                forward, backward = tuple(forward), tuple(backward)
+                np.minimum(spread[forward], labels[backward], out=spread[forward])
+                np.minimum(spread[backward], labels[forward], out=spread[backward])
+            spread[~air] = blocked
+            if np.array_equal(spread, labels):
+                break
+            labels = spread
+
+        last = CHUNK_SIZE - 1
+        boundaries = []
+        for normal in FACE_NORMALS:
+            index = [slice(None)] * 3
+            axis = next(a for a in range(3) if normal[a])
+            index[axis] = last if normal[axis] > 0 else 0
+            boundaries.append(np.unique(labels[tuple(index)]))
+
+        faces_touched = {}  # label -> bitmask of faces the pocket reaches
+        for face, pocket_labels in enumerate(boundaries):
+            for label in pocket_labels.tolist():
+                if label != blocked:
+                    faces_touched[label] = faces_touched.get(label, 0) | (1 << face)
+        self.visibility = [0] * 6
+        for mask in faces_touched.values():
+            for face in range(6):
+                if mask & (1 << face):
+                    self.visibility[face] |= mask
+        return self.visibility
+
+
+class BlockEdit:
+    """One bulk edit, kept compact for undo and redo.
+
+    For each chunk it touched, stores a zlib-compressed bitmask of the changed
+    voxels followed by their old and new block ids.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.diffs = {}  # chunk key -> compressed mask + before + after
+        self.blocks = 0  # Voxels changed
+
+    def record(self, key, mask, before, after):
+        self.diffs[key] = zlib.compress(np.packbits(mask).tobytes() + before.tobytes() + after.tobytes())
+        self.blocks += len(before)
+
+    def changes(self, undo=False):
+        """Yields (chunk key, mask, block ids) that redo the edit, or undo it."""
+        mask_bytes = CHUNK_VOLUME // 8
+        for key, diff in self.diffs.items():
+            raw = zlib.decompress(diff)
+            mask = np.unpackbits(np.frombuffer(raw, np.uint8, mask_bytes)).astype(bool).reshape((CHUNK_SIZE,) * 3)
+            count = (len(raw) - mask_bytes) // 2
+            start = mask_bytes if undo else mask_bytes + count
+            yield key, mask, np.frombuffer(raw, np.uint8, count, start)
+
+    @property
+    def nbytes(self):
+        return sum(len(diff) for diff in self.diffs.values())
+
+
 class World:
-    def __init__(self):
-        self.blocks = {} # Dictionary: (x,y,z) -> texture_id
-        self.generate_flat_world()
+    def __init__(self, seed=None, generate=True):
+        self.chunks = {} # Dictionary: (cx,cy,cz) -> Chunk
+        self.draw_stats = {}
+        self.undo_stack = deque(maxlen=UNDO_LIMIT)  # BlockEdits from bulk operations
+        self.redo_stack = []
+        self.edit_listeners = []  # Called as listener(pos, block_id) after add_block/remove_block
+        if not generate:
+            return  # Starts empty, e.g. to be filled from a server
+        if seed is None:
+            self.generate_flat_world()
+        else:
+            self.generate_terrain(seed)
 
     def generate_flat_world(self):
         # Generate a simple 10x10 floor
         for x in range(-5, 5):
             for z in range(-5, 5):
-                self.add_block((x, -2, z), 'grass')
+                self.get_chunk(chunk_key(x, -2, z), create=True).data[BLOCKS][local_index(x, -2, z)] = BLOCK_IDS['grass']
+        self.compute_lighting()
+
+    def generate_terrain(self, seed, size=256, depth=64):
+        """Generates hilly terrain with caves, size x size blocks around the origin and
+        `depth` blocks deep, with the surface a few blocks below y=0. Seeded and vectorised.
+        Chunks at the edges of the area are only partly filled when it isn't chunk aligned."""
+        rng = np.random.default_rng(seed)
+        half = size // 2
+        xs, zs = np.mgrid[0:size, 0:size].astype(np.float32)
+        phases = rng.random(4) * 2 * math.pi
+        surface = (depth - 12 + 3 * np.sin(xs / 11 + phases[0]) + 3 * np.sin(zs / 13 + phases[1])
+                   + 2 * np.sin((xs + zs) / 7 + phases[2])).astype(int)
+        ys = np.arange(depth)[None, :, None]
+        column = surface[:, None, :]
+        blocks = np.where(ys < column - 3, BLOCK_IDS['stone'],
+                          np.where(ys < column, BLOCK_IDS['dirt'],
+                                   np.where(ys == column, BLOCK_IDS['grass'], 0))).astype(np.uint8)
+
+        # Caves: smooth value noise from a coarse random lattice, upsampled trilinearly
+        scale = 8
+        lattice = rng.random((size // scale + 2, depth // scale + 2, size // scale + 2)).astype(np.float32)
+        def axis_weights(n):
+            pos = np.arange(n, dtype=np.float32) / scale
+            cell = pos.astype(int)
+            t = pos - cell
+            return cell, t * t * (3 - 2 * t)  # smoothstep
+        (ix, tx), (iy, ty), (iz, tz) = axis_weights(size), axis_weights(depth), axis_weights(size)
+        ix, tx = ix[:, None, None], tx[:, None, None]
+        iy, ty = iy[None, :, None], ty[None, :, None]
+        iz, tz = iz[None, None, :], tz[None, None, :]
+        noise = 0
+        for dx, wx in ((0, 1 - tx), (1, tx)):
+            for dy, wy in ((0, 1 - ty), (1, ty)):
+                for dz, wz in ((0, 1 - tz), (1, tz)):
+                    noise = noise + lattice[ix + dx, iy + dy, iz + dz] * wx * wy * wz
+        caves = (noise > 0.7) & (ys < column - 4) & (ys > 1)
+        blocks[caves] = 0
+
+        # Copy into every chunk the terrain overlaps; the origin needn't be chunk aligned
+        origin = (-half, -depth, -half)
+        self.chunks.clear()
+        key_ranges = [range(o >> CHUNK_SHIFT, ((o + n - 1) >> CHUNK_SHIFT) + 1) for o, n in zip(origin, blocks.shape)]
+        for key in itertools.product(*key_ranges):
+            src, dst = [], []
+            for c, o, n in zip(key, origin, blocks.shape):
+                start, end = max(o, c << CHUNK_SHIFT), min(o + n, (c + 1) << CHUNK_SHIFT)
+                src.append(slice(start - o, end - o))
+                dst.append(slice(start - (c << CHUNK_SHIFT), end - (c << CHUNK_SHIFT)))
+            self.get_chunk(key, create=True).arrays[BLOCKS][tuple(dst)] = blocks[tuple(src)]
+        self.compute_lighting()
+
+    # --- Block access ---
+    def get_chunk(self, key, create=False):
+        chunk = self.chunks.get(key)
+        if chunk is None and create:
+            chunk = self.chunks[key] = Chunk(key)
+        return chunk
+
+    def get_block(self, pos):
+        """Returns the type name of the block at pos, or None for air."""
+        chunk = self.chunks.get(chunk_key(*pos))
+        if chunk is None:
+            return None
+        return BLOCK_NAMES[chunk.data[BLOCKS][local_index(*pos)]]
+
+    def get_light(self, pos, layer):
+        chunk = self.chunks.get(chunk_key(*pos))
+        if chunk is None:
+            return LAYER_DEFAULTS[layer]
+        return chunk.data[layer][local_index(*pos)]
 
     def add_block(self, pos, type_name):
-        self.blocks[pos] = type_name
+        block_id = BLOCK_IDS[type_name]
+        key = chunk_key(*pos)
+        changed = set()
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.get_chunk(key, create=True)
+            # The chunk read as open sky while it was missing; now it is air lit by its
+            # surroundings, which can also darken the columns below and beside it
+            self._after_bulk_edit([key])
+        i = local_index(*pos)
+        chunk.data[BLOCKS][i] = block_id
+        chunk.visibility = None
+        # The block is opaque: whatever light was in this voxel goes away
+        for layer in (SKY_LIGHT, BLOCK_LIGHT):
+            old = chunk.data[layer][i]
+            if old:
+                chunk.data[layer][i] = 0
+                self._remove_light(layer, deque([(pos[0], pos[1], pos[2], old)]), changed)
+        emission = BLOCK_EMISSION.get(block_id, 0)
+        if emission:
+            chunk.data[BLOCK_LIGHT][i] = emission
+            self._spread_light(BLOCK_LIGHT, deque([pos]), changed)
+        self._mark_dirty(pos, changed)
+        self.redo_stack.clear()  # Redoing an older bulk edit now would overwrite this block
+        for listener in self.edit_listeners:
+            listener(pos, block_id)
 
     def remove_block(self, pos):
-        if pos in self.blocks:
-            del self.blocks[pos]
+        chunk = self.chunks.get(chunk_key(*pos))
+        if chunk is None:
+            return
+        i = local_index(*pos)
+        if not chunk.data[BLOCKS][i]:
+            return
+        changed = set()
+        emitted = chunk.data[BLOCK_LIGHT][i]
+        chunk.data[BLOCKS][i] = 0
+        chunk.visibility = None
+        if emitted:
+            chunk.data[BLOCK_LIGHT][i] = 0
+            self._remove_light(BLOCK_LIGHT, deque([(pos[0], pos[1], pos[2], emitted)]), changed)
+        # The voxel is air now: let the surrounding light flow back into it
+        x, y, z = pos
+        for layer in (SKY_LIGHT, BLOCK_LIGHT):
+            self._spread_light(layer, deque((x + dx, y + dy, z + dz) for dx, dy, dz in NEIGHBOURS), changed)
+        self._mark_dirty(pos, changed)
+        self.redo_stack.clear()
+        for listener in self.edit_listeners:
+            listener(pos, 0)
+
+    def _mark_dirty(self, pos, light_changed):
+        """Flags meshes touched by an edit: every chunk within one block of pos (faces and
+        ambient occlusion) plus every chunk whose light changed, and its face neighbours."""
+        x, y, z = pos
+        keys = {chunk_key(x + dx, y + dy, z + dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)}
+        for cx, cy, cz in light_changed:
+            keys.add((cx, cy, cz))
+            keys.update((cx + dx, cy + dy, cz + dz) for dx, dy, dz in NEIGHBOURS)
+        for key in keys:
+            chunk = self.chunks.get(key)
+            if chunk is not None:
+                chunk.dirty = True
+
+    # --- Bulk edits ---
+    # Region operations write whole array slices into each chunk they overlap, relight
+    # the affected chunk columns once and mark meshes dirty once, however many blocks
+    # change. Each is recorded as a BlockEdit on the undo stack. Corners are inclusive.
+
+    def fill_box(self, corner1, corner2, type_name):
+        """Fills the box between two corners with a block type (None for air)."""
+        lo, hi = self._box(corner1, corner2)
+        values = np.full([h - l for l, h in zip(lo, hi)], self._block_id(type_name), np.uint8)
+        return self.write_blocks(lo, values, name='fill')
+
+    def hollow_box(self, corner1, corner2, type_name):
+        """Builds the walls, floor and ceiling of a box and empties its inside."""
+        lo, hi = self._box(corner1, corner2)
+        values = np.full([h - l for l, h in zip(lo, hi)], self._block_id(type_name), np.uint8)
+        values[1:-1, 1:-1, 1:-1] = 0
+        return self.write_blocks(lo, values, name='hollow box')
+
+    def sphere(self, centre, radius, type_name):
+        """Fills every block within radius of centre."""
+        lo = tuple(c - radius for c in centre)
+        offsets = np.ogrid[-radius:radius + 1, -radius:radius + 1, -radius:radius + 1]
+        inside = offsets[0] ** 2 + offsets[1] ** 2 + offsets[2] ** 2 <= radius * radius
+        values = np.full(inside.shape, self._block_id(type_name), np.uint8)
+        return self.write_blocks(lo, values, inside, name='sphere')
+
+    def replace(self, corner1, corner2, old_type, new_type):
+        """Changes every block of one type in the box to another."""
+        lo, hi = self._box(corner1, corner2)
+        matches = self.read_region(lo, hi, BLOCKS) == self._block_id(old_type)
+        values = np.full(matches.shape, self._block_id(new_type), np.uint8)
+        return self.write_blocks(lo, values, matches, name='replace')
+
+    def copy(self, corner1, corner2):
+        """Returns the block ids in the box as an [x, y, z] array, for paste."""
+        return self.read_region(*self._box(corner1, corner2), BLOCKS)
+
+    def paste(self, pos, blocks, skip_air=False):
+        """Writes a copied region with its lowest corner at pos."""
+        return self.write_blocks(tuple(pos), blocks, blocks != 0 if skip_air else None, name='paste')
+
+    def undo(self):
+        """Reverts the last bulk edit. Returns it, or None if there was nothing to undo."""
+        if not self.undo_stack:
+            return None
+        edit = self.undo_stack.pop()
+        self._apply_changes(edit.changes(undo=True))
+        self.redo_stack.append(edit)
+        return edit
+
+    def redo(self):
+        """Re-applies the last undone bulk edit. Returns it, or None."""
+        if not self.redo_stack:
+            return None
+        edit = self.redo_stack.pop()
+        self._apply_changes(edit.changes())
+        self.undo_stack.append(edit)
+        return edit
+
+    @staticmethod
+    def _block_id(type_name):
+        return BLOCK_IDS[type_name] if type_name else 0
+
+    @staticmethod
+    def _box(corner1, corner2):
+        """(lo, hi) with hi exclusive, for the box between two inclusive corners."""
+        return (tuple(min(a, b) for a, b in zip(corner1, corner2)),
+                tuple(max(a, b) + 1 for a, b in zip(corner1, corner2)))
+
+    def write_blocks(self, lo, values, mask=None, name='edit'):
+        """Writes an [x, y, z] array of block ids into the world with its lowest corner
+        at lo, only where mask is set. Returns the recorded BlockEdit."""
+        hi = tuple(l + s for l, s in zip(lo, values.shape))
+        edit = BlockEdit(name)
+        key_lo = [l >> CHUNK_SHIFT for l in lo]
+        key_hi = [(h - 1) >> CHUNK_SHIFT for h in hi]
+        for cx in range(key_lo[0], key_hi[0] + 1):
+            for cy in range(key_lo[1], key_hi[1] + 1):
+                for cz in range(key_lo[2], key_hi[2] + 1):
+                    key = (cx, cy, cz)
+                    src, dst = [], []
+                    for c, l, h in zip(key, lo, hi):
+                        start = max(l, c << CHUNK_SHIFT)
+                        end = min(h, (c + 1) << CHUNK_SHIFT)
+                        src.append(slice(start - l, end - l))
+                        dst.append(slice(start - (c << CHUNK_SHIFT), end - (c << CHUNK_SHIFT)))
+                    src, dst = tuple(src), tuple(dst)
+                    new = values[src]
+                    selected = np.ones(new.shape, bool) if mask is None else mask[src]
+                    chunk = self.chunks.get(key)
+                    if chunk is None:
+                        # Only create chunks that actually get blocks
+                        if not (new[selected] != 0).any():
+                            continue
+                        chunk = self.get_chunk(key, create=True)
+                    current = chunk.arrays[BLOCKS][dst]
+                    changed = selected & (current != new)
+                    if not changed.any():
+                        continue
+                    chunk_mask = np.zeros((CHUNK_SIZE,) * 3, bool)
+                    chunk_mask[dst] = changed
+                    edit.record(key, chunk_mask, current[changed], new[changed])
+                    current[changed] = new[changed]
+        if edit.diffs:
+            self._after_bulk_edit(edit.diffs)
+            self.undo_stack.append(edit)
+            self.redo_stack.clear()
+            # Keep the newest edit however big it is, dropping older ones past the budget
+            undo_bytes = sum(recorded.nbytes for recorded in self.undo_stack)
+            while len(self.undo_stack) > 1 and undo_bytes > UNDO_BUDGET:
+                undo_bytes -= self.undo_stack.popleft().nbytes
+        return edit
+
+    def load_chunks(self, blocks):
+        """Replaces the blocks of whole chunks, given as {key: [x, y, z] array} (e.g.
+        received from a server), then relights around them and marks meshes dirty."""
+        for key, array in blocks.items():
+            self.get_chunk(key, create=True).arrays[BLOCKS][:] = array
+        if blocks:
+            self._after_bulk_edit(list(blocks))
+
+    def _apply_changes(self, changes):
+        keys = []
+        for key, mask, values in changes:
+            self.get_chunk(key, create=True).arrays[BLOCKS][mask] = values
+            keys.append(key)
+        self._after_bulk_edit(keys)
+
+    def _after_bulk_edit(self, keys):
+        """Relights the chunk columns around the changed chunks and marks meshes dirty:
+        the changed chunks and everything next to them, plus chunks whose light changed
+        and their face neighbours."""
+        for key in keys:
+            self.chunks[key].visibility = None
+        # Light spreads at most MAX_LIGHT < CHUNK_SIZE blocks sideways, so one ring of
+        # columns around the edit is enough; sunlight can change all the way down
+        columns = {(cx + dx, cz + dz) for cx, _, cz in keys for dx in (-1, 0, 1) for dz in (-1, 0, 1)}
+        region = [key for key in self.chunks if (key[0], key[2]) in columns]
+        before = {key: (bytes(self.chunks[key].data[SKY_LIGHT]), bytes(self.chunks[key].data[BLOCK_LIGHT])) for key in region}
+        self.compute_lighting(region)
+
+        dirty = set()
+        for cx, cy, cz in keys:
+            dirty.update((cx + dx, cy + dy, cz + dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1))
+        for key in region:
+            chunk = self.chunks[key]
+            if (chunk.data[SKY_LIGHT], chunk.data[BLOCK_LIGHT]) != before[key]:
+                dirty.add(key)
+                dirty.update((key[0] + dx, key[1] + dy, key[2] + dz) for dx, dy, dz in NEIGHBOURS)
+        for key in dirty:
+            chunk = self.chunks.get(key)
+            if chunk is not None:
+                chunk.dirty = True
+
+    # --- Lighting ---
+    # Light is flood-filled with BFS queues, one pass per layer. Sunlight at full
+    # strength travels straight down without fading; everything else loses one
+    # level per block. Edits only ever touch the voxels whose light changes.
+
+    def _spread_light(self, layer, queue, changed):
+        """Propagates light outwards from every position in the queue."""
+        chunks = self.chunks
+        default = LAYER_DEFAULTS[layer]
+        while queue:
+            x, y, z = queue.popleft()
+            chunk = chunks.get((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT, z >> CHUNK_SHIFT))
+            level = chunk.data[layer][local_index(x, y, z)] if chunk is not None else default
+            if level <= 1:
+                continue
+            for dx, dy, dz in NEIGHBOURS:
+                nx, ny, nz = x + dx, y + dy, z + dz
+                key = (nx >> CHUNK_SHIFT, ny >> CHUNK_SHIFT, nz >> CHUNK_SHIFT)
+                neighbour = chunks.get(key)
+                if neighbour is None:
+                    continue
+                i = local_index(nx, ny, nz)
+                if neighbour.data[BLOCKS][i]:
+                    continue
+                new_level = level if (layer == SKY_LIGHT and dy == -1 and level == MAX_LIGHT) else level - 1
+                light = neighbour.data[layer]
+                if light[i] < new_level:
+                    light[i] = new_level
+                    changed.add(key)
+                    queue.append((nx, ny, nz))
+
+    def _remove_light(self, layer, queue, changed):
+        """Darkens everything that was lit by the (x, y, z, old_level) entries in the queue,
+        then re-spreads light from the brighter voxels found at the edge of the dark area."""
+        chunks = self.chunks
+        relight = deque()
+        while queue:
+            x, y, z, level = queue.popleft()
+            for dx, dy, dz in NEIGHBOURS:
+                nx, ny, nz = x + dx, y + dy, z + dz
+                key = (nx >> CHUNK_SHIFT, ny >> CHUNK_SHIFT, nz >> CHUNK_SHIFT)
+                neighbour = chunks.get(key)
+                if neighbour is None:
+                    # Missing chunks are open sky and can light the area back up
+                    relight.append((nx, ny, nz))
+                    continue
+                i = local_index(nx, ny, nz)
+                light = neighbour.data[layer]
+                neighbour_level = light[i]
+                if not neighbour_level:
+                    continue
+                if neighbour.data[BLOCKS][i]:
+                    # Only light-emitting blocks hold light; they are sources, not receivers
+                    relight.append((nx, ny, nz))
+                elif neighbour_level < level or (layer == SKY_LIGHT and dy == -1 and level == MAX_LIGHT):
+                    light[i] = 0
+                    changed.add(key)
+                    queue.append((nx, ny, nz, neighbour_level))
+                else:
+                    relight.append((nx, ny, nz))
+        self._spread_light(layer, relight, changed)
+
+    def compute_lighting(self, keys=None):
+        """Lights the whole world (or just the chunks in keys) from scratch. Used after
+        generating terrain and after bulk edits; single-block edits are handled
+        incrementally by add_block/remove_block.
+
+        Works on one array covering the chunks plus a one-block border. Sunlight is
+        first dropped down every column, then each layer is spread with whole-array
+        max-minus-one steps until nothing changes (at most MAX_LIGHT of them), which
+        gives the same light as the BFS. Voxels outside the relit chunks keep their
+        light and shine in from outside, so a partial relight must cover whole chunk
+        columns. Only a whole-world relight marks meshes dirty.
+        """
+        chunks = list(self.chunks.values()) if keys is None else [self.chunks[key] for key in keys if key in self.chunks]
+        if not chunks:
+            return
+        lo = [min(chunk.origin[axis] for chunk in chunks) - 1 for axis in range(3)]
+        hi = [max(chunk.origin[axis] for chunk in chunks) + CHUNK_SIZE + 1 for axis in range(3)]
+        blocks = self.read_region(lo, hi, BLOCKS)
+        inside = {}  # chunk -> its slices of the region arrays
+        free = np.zeros(blocks.shape, bool)  # Voxels being relit
+        for chunk in chunks:
+            inside[chunk] = tuple(slice(o - l, o - l + CHUNK_SIZE) for o, l in zip(chunk.origin, lo))
+            free[inside[chunk]] = True
+        air = blocks == 0
+        spreads = free & air
+
+        # Sunlight falls from the top of each column (open sky above the region) until it
+        # hits a block. Voxels that are not being relit keep their light, so full sunlight
+        # also falls on out of any of them already at MAX_LIGHT, e.g. a missing chunk.
+        sky = self.read_region(lo, hi, SKY_LIGHT)
+        sunlit = np.zeros(blocks.shape, bool)
+        above = np.ones(blocks[:, 0, :].shape, bool)
+        for y in range(blocks.shape[1] - 1, -1, -1):
+            above = np.where(free[:, y], air[:, y] & above, sky[:, y] == MAX_LIGHT)
+            sunlit[:, y] = above
+        emission = np.zeros(256, np.uint8)
+        for block_id, level in BLOCK_EMISSION.items():
+            emission[block_id] = level
+        sources = {SKY_LIGHT: np.where(sunlit, MAX_LIGHT, 0).astype(np.uint8), BLOCK_LIGHT: emission[blocks]}
+
+        # (forward, backward) slices pairing each voxel with its neighbour along each axis
+        shifts = []
+        for axis in range(3):
+            forward, backward = [slice(None)] * 3, [slice(None)] * 3
+            forward[axis], backward[axis] = slice(1, None), slice(None, -1)
+            shifts.append((tuple(forward), tuple(backward)))
+        held = ~spreads
+        for layer, source in sources.items():
+            light = np.where(free, source, sky if layer == SKY_LIGHT else self.read_region(lo, hi, layer))
+            spread = np.empty_like(light)  # Reused between steps, which run in place
+            for _ in range(MAX_LIGHT):
+                spread.fill(0)
+                for forward, backward in shifts:
+                    np.maximum(spread[forward], light[backward], out=spread[forward])
+                    np.maximum(spread[backward], light[forward], out=spread[backward])
+                np.maximum(spread, 1, out=spread)
+                spread -= 1
+                np.maximum(spread, light, out=spread)
+                np.copyto(spread, light, where=held)
+                if np.array_equal(spread, light):
+                    break
+                light, spread = spread, light
+            for chunk, region in inside.items():
+                chunk.arrays[layer][:] = light[region]
+
+        if keys is None:
+            for chunk in self.chunks.values():
+                chunk.dirty = True
+
+    # --- Meshing ---
+    def read_region(self, lo, hi, layer=BLOCKS):
+        """Copies the box lo <= pos < hi of one data layer into a new [x, y, z] array.
+        Voxels in missing chunks read as LAYER_DEFAULTS."""
+        shape = tuple(h - l for l, h in zip(lo, hi))
+        out = np.full(shape, LAYER_DEFAULTS[layer], np.uint8)
+        key_lo = [l >> CHUNK_SHIFT for l in lo]
+        key_hi = [(h - 1) >> CHUNK_SHIFT for h in hi]
+        for cx in range(key_lo[0], key_hi[0] + 1):
+            for cy in range(key_lo[1], key_hi[1] + 1):
+                for cz in range(key_lo[2], key_hi[2] + 1):
+                    chunk = self.chunks.get((cx, cy, cz))
+                    if chunk is None:
+                        continue
+                    src, dst = [], []
+                    for c, l, h in zip((cx, cy, cz), lo, hi):
+                        start = max(l, c << CHUNK_SHIFT)
+                        end = min(h, (c + 1) << CHUNK_SHIFT)
+                        src.append(slice(start - (c << CHUNK_SHIFT), end - (c << CHUNK_SHIFT)))
+                        dst.append(slice(start - l, end - l))
+                    out[tuple(dst)] = chunk.arrays[layer][tuple(src)]
+        return out
+
+    def build_mesh(self, chunk, scale=1):
+        """Builds the chunk's visible faces as (vertex_data, ranges).
+
+        vertex_data holds texture coordinates, colour and position for every vertex
+        (GL_T2F_C3F_V3F), sorted by block id; ranges lists (block id, first vertex,
+        vertex count) so each block type can be drawn with its own texture.
+
+        Only faces next to air are emitted. Each vertex colour bakes in the light
+        level of the air the face looks into, a fixed per-direction shade, and
+        ambient occlusion from the three blocks around that corner. With scale > 1
+        the chunk is first merged into scale^3 cells (see downsample).
+        """
+        lo = tuple(c - 1 for c in chunk.origin)
+        hi = tuple(c + CHUNK_SIZE + 1 for c in chunk.origin)
+        blocks = self.read_region(lo, hi, BLOCKS)
+        light = np.maximum(self.read_region(lo, hi, SKY_LIGHT), self.read_region(lo, hi, BLOCK_LIGHT))
+        if scale == 1:
+            solid = blocks != 0
+        else:
+            solid, blocks, light = downsample(blocks, light, scale)
+        n = CHUNK_SIZE // scale
+        # A cell spans scale blocks, starting half a block before its first voxel's centre
+        ox, oy, oz = (c - 0.5 + 0.5 * scale for c in chunk.origin)
+        tex_coords = np.array(TEX_COORDS, np.float32) * scale  # Textures repeat once per block
+
+        def shifted(array, offset):
+            """array[1 + x + offset] for every x, y, z inside the chunk."""
+            return array[1 + offset[0]:1 + n + offset[0], 1 + offset[1]:1 + n + offset[1], 1 + offset[2]:1 + n + offset[2]]
+
+        parts = []  # (block ids, vertices, colours) per face direction
+        for face, normal, shade in zip(FACES, FACE_NORMALS, FACE_SHADE):
+            exposed = shifted(solid, (0, 0, 0)) & ~shifted(solid, normal)
+            xs, ys, zs = np.nonzero(exposed)
+            if not len(xs):
+                continue
+            face_light = LIGHT_CURVE[shifted(light, normal)[xs, ys, zs]] * shade
+            vertices = np.empty((len(xs), 4, 3), np.float32)
+            colours = np.empty((len(xs), 4), np.float32)
+            for corner, vertex_index in enumerate(face):
+                vertex = VERTICES[vertex_index]
+                vertices[:, corner, 0] = xs * scale + (ox + vertex[0] * scale)
+                vertices[:, corner, 1] = ys * scale + (oy + vertex[1] * scale)
+                vertices[:, corner, 2] = zs * scale + (oz + vertex[2] * scale)
+                # The two blocks beside this corner and the one diagonal to it, in front of the face
+                side_offsets = []
+                for axis in range(3):
+                    if normal[axis] == 0:
+                        offset = list(normal)
+                        offset[axis] = 1 if vertex[axis] > 0 else -1
+                        side_offsets.append(tuple(offset))
+                diagonal = tuple(a + b - c for a, b, c in zip(side_offsets[0], side_offsets[1], normal))
+                side1 = shifted(solid, side_offsets[0])[xs, ys, zs]
+                side2 = shifted(solid, side_offsets[1])[xs, ys, zs]
+                corner_block = shifted(solid, diagonal)[xs, ys, zs]
+                ao = np.where(side1 & side2, 0, 3 - (side1.astype(np.int8) + side2 + corner_block))
+                colours[:, corner] = face_light * AO_CURVE[ao]
+            parts.append((shifted(blocks, (0, 0, 0))[xs, ys, zs], vertices, colours))
+
+        if not parts:
+            return np.empty((0, 8), np.float32), []
+        ids = np.concatenate([p[0] for p in parts])
+        order = np.argsort(ids, kind='stable')
+        ids = ids[order]
+        vertices = np.concatenate([p[1] for p in parts])[order]
+        colours = np.concatenate([p[2] for p in parts])[order]
+        data = np.empty((len(ids), 4, 8), np.float32)
+        data[:, :, 0:2] = tex_coords
+        data[:, :, 2:5] = colours[:, :, None]
+        data[:, :, 5:8] = vertices
+        block_ids, firsts, counts = np.unique(ids, return_index=True, return_counts=True)
+        ranges = [(int(b), int(f) * 4, int(c) * 4) for b, f, c in zip(block_ids, firsts, counts)]
+        return data.reshape(-1, 8), ranges
+
+    # --- Visibility ---
+    def visible_chunks(self, camera_pos, max_distance=FAR_CLIP):
+        """Returns the chunks that could be visible from camera_pos.
+
+        Walks outwards from the camera's chunk. A neighbour is only entered through
+        a face the current chunk can see from the face we came in by, and the walk
+        never turns back against a direction it has already moved in, so chunks
+        sealed off underground are never reached.
+        """
+        start = chunk_key(*(int(round(c)) for c in camera_pos))
+        radius = int(max_distance) // CHUNK_SIZE + 1
+        keys = list(self.chunks) + [start]
+        lower = [min(key[axis] for key in keys) for axis in range(3)]
+        upper = [max(key[axis] for key in keys) for axis in range(3)]
+
+        visible = []
+        visited = {start}
+        queue = deque([(start, None, 0)])  # chunk key, face entered through, directions moved in
+        while queue:
+            key, entered, moved = queue.popleft()
+            chunk = self.chunks.get(key)
+            if chunk is not None:
+                visible.append(chunk)
+                connectivity = chunk.face_connectivity()
+            else:
+                connectivity = [ALL_FACES] * 6  # Missing chunks are open air
+            for face, normal in enumerate(FACE_NORMALS):
+                if moved & (1 << OPPOSITE_FACE[face]):
+                    continue
+                if entered is not None and not connectivity[entered] & (1 << face):
+                    continue
+                neighbour = (key[0] + normal[0], key[1] + normal[1], key[2] + normal[2])
+                if neighbour in visited:
+                    continue
+                if any(not lower[a] <= neighbour[a] <= upper[a] or abs(neighbour[a] - start[a]) > radius for a in range(3)):
+                    continue
+                visited.add(neighbour)
+                queue.append((neighbour, OPPOSITE_FACE[face], moved | (1 << face)))
+        return visible
+
+    # --- Level of detail ---
+    def lod_scale(self, chunk, camera_pos, lod_distances=LOD_DISTANCES):
+        """The scale to mesh a chunk at, from its centre's distance to the camera."""
+        centre = [o + CHUNK_SIZE / 2 - 0.5 for o in chunk.origin]
+        return LOD_SCALES[bisect.bisect(lod_distances, math.dist(centre, camera_pos))]
+
+    def chunk_mesh(self, chunk, scale=1):
+        """Returns the chunk's mesh at one scale, building it the first time that scale
+        is needed. Each scale is cached separately; an edit (or relight) touching the
+        chunk drops them all, and each is only rebuilt once it is drawn again."""
+        if chunk.dirty:
+            chunk.meshes.clear()
+            chunk.dirty = False
+        mesh = chunk.meshes.get(scale)
+        if mesh is None:
+            mesh = chunk.meshes[scale] = self.build_mesh(chunk, scale)
+        return mesh
+
+    def meshes_to_draw(self, camera_pos=None, view_distance=FAR_CLIP, lod_distances=LOD_DISTANCES):
+        """Returns (chunk, scale, mesh) for everything World.draw would draw. Without a
+        camera position every chunk is drawn at full detail; pass lod_distances=() to
+        keep full detail out to view_distance."""
+        if camera_pos is None:
+            return [(chunk, 1, self.chunk_mesh(chunk)) for chunk in self.chunks.values()]
+        selected = []
+        for chunk in self.visible_chunks(camera_pos, view_distance):
+            scale = self.lod_scale(chunk, camera_pos, lod_distances)
+            selected.append((chunk, scale, self.chunk_mesh(chunk, scale)))
+        return selected
+
+    def draw(self, texture_mgr, camera_pos=None, view_distance=FAR_CLIP, lod_distances=LOD_DISTANCES):
+        """Draws the world. With a camera position, only potentially visible chunks are
+        drawn, with coarser meshes further away."""
+        selected = self.meshes_to_draw(camera_pos, view_distance, lod_distances)
 
-    def draw(self, texture_mgr):
         glEnable(GL_TEXTURE_2D)
-        
-        # Start drawing Quads
-        glBegin(GL_QUADS)
-        
-        for pos, type_name in self.blocks.items():
-            x, y, z = pos
-            tex_id = texture_mgr.textures.get(type_name)
-            
-            # Note: In a real engine, you'd batch these or sort by texture.
-            # Here we are keeping it simple, which is inefficient but readable.
-            
-            # We have to unbind/bind inside loop because we are in immediate mode block
-            # Actually, 'glEnd' and 'glBegin' inside a loop is bad practice, 
-            # but we need to change texture state.
-            glEnd() 
-            glBindTexture(GL_TEXTURE_2D, tex_id)
-            glBegin(GL_QUADS)
-
-            for face in FACES:
-                for i, vertex_index in enumerate(face):
-                    vx, vy, vz = VERTICES[vertex_index]
-                    glTexCoord2f(*TEX_COORDS[i])
-                    glVertex3f(vx + x, vy + y, vz + z)
-        glEnd()
+
+        quads = 0
+        lods = dict.fromkeys(LOD_SCALES, 0)
+        for chunk, scale, (vertex_data, ranges) in selected:
+            lods[scale] += 1
+            if not ranges:
+                continue
+            # One call points GL at all of the chunk's vertex data (and enables the arrays)
+            glInterleavedArrays(GL_T2F_C3F_V3F, 0, vertex_data)
+            quads += len(vertex_data) // 4
+            for block_id, first, count in ranges:
+                glBindTexture(GL_TEXTURE_2D, texture_mgr.textures.get(BLOCK_NAMES[block_id]))
+                glDrawArrays(GL_QUADS, first, count)
+
+        glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glColor3f(1, 1, 1)
         glDisable(GL_TEXTURE_2D)
+        self.draw_stats = {'chunks': len(self.chunks), 'drawn': len(selected), 'quads': quads, 'lods': lods}
 
 class Player:
     def __init__(self):
@@ -207,7 +994,7 @@ def raycast(player, world, distance=5):
 
     # Walk along ray
     for _ in range(int(distance * 3)): # rough iteration count
-        if (vx, vy, vz) in world.blocks:
+        if world.get_block((vx, vy, vz)):
             return (vx, vy, vz), last_voxel
         
         last_voxel = (vx, vy, vz)
@@ -261,6 +1048,11 @@ def draw_crosshair():
     glPopMatrix()
 
 def main():
+    parser = argparse.ArgumentParser(description="PyGame Minecraft Clone")
+    parser.add_argument("--seed", type=int, help="generate deep terrain with caves from this seed instead of the flat floor")
+    parser.add_argument("--connect", metavar="HOST:PORT", help="play in a world_server.py world instead of a local one")
+    args = parser.parse_args()
+
     pygame.init()
     pygame.display.set_caption("PyGame Minecraft Clone")
     pygame.mouse.set_visible(False)
@@ -282,12 +1074,21 @@ def main():
     tex_mgr.generate_texture('grass', GRASS_COLOR)
     tex_mgr.generate_texture('dirt', DIRT_COLOR)
     tex_mgr.generate_texture('stone', STONE_COLOR)
+    tex_mgr.generate_texture('glowstone', GLOWSTONE_COLOR)
     
-    world = World()
+    client = None
+    if args.connect:
+        from world_server import COLUMNS_PER_FRAME, connect_in_background
+        host, _, port = args.connect.rpartition(':')
+        client = connect_in_background(host, int(port))
+        world = client.world
+    else:
+        world = World(args.seed)
     player = Player()
     
     clock = pygame.time.Clock()
     running = True
+    place_type = 'stone' # Number keys 1-4 pick the block to place
     
     while running:
         dt = clock.tick(60) / 1000.0
@@ -299,6 +1100,19 @@ def main():
             if event.type == pygame.KEYDOWN:
                 if event.key == K_ESCAPE:
                     running = False
+                if K_1 <= event.key < K_1 + len(BLOCK_IDS):
+                    place_type = BLOCK_NAMES[event.key - K_1 + 1]
+                # Z / Y undo and redo bulk edits; F and G fill or carve a sphere where you look.
+                # Bulk edits aren't sent to a server, so they are off while connected.
+                if client is None:
+                    if event.key == K_z:
+                        world.undo()
+                    elif event.key == K_y:
+                        world.redo()
+                    elif event.key in (K_f, K_g):
+                        hit_block, _ = raycast(player, world, distance=30)
+                        if hit_block:
+                            world.sphere(hit_block, BRUSH_RADIUS, place_type if event.key == K_f else None)
             
             # Mouse Clicks (Block interaction)
             if event.type == pygame.MOUSEBUTTONDOWN:
@@ -311,11 +1125,15 @@ def main():
                         # Prevent placing inside player
                         px, py, pz = int(round(player.pos[0])), int(round(player.pos[1])), int(round(player.pos[2]))
                         if prev_block != (px, py, pz):
-                            world.add_block(prev_block, 'stone')
+                            world.add_block(prev_block, place_type)
 
         # Update Player
         keys = pygame.key.get_pressed()
         player.update(dt, keys)
+        if client is not None:
+            # Other players' edits received since the last frame, and a few more streamed columns
+            client.apply_pending(COLUMNS_PER_FRAME)
+            client.send_position(player.pos)
         
         # Render
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
@@ -330,7 +1148,7 @@ def main():
         glTranslatef(-player.pos[0], -player.pos[1], -player.pos[2])
         
         # Draw Scene
-        world.draw(tex_mgr)
+        world.draw(tex_mgr, player.pos)
         draw_crosshair()
         
         pygame.display.flip()
@@ -1,12 +1,38 @@
 import pygame
+import numpy as np
+import os
 import random
+import struct
 import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
 
 # --- CONSTANTS & SETTINGS ---
 TILE_SIZE = 32
 WIDTH, HEIGHT = 800, 640  # Screen size
 FPS = 60
 
+# Enemy AI
+CHASE_RANGE = 300                    # Enemies chase the player inside this distance
+NEAR_RANGE = CHASE_RANGE + TILE_SIZE # Updated every frame, exactly as before
+MID_RANGE = 1000                     # Updated round-robin, every MID_INTERVAL frames
+MID_INTERVAL = 10                    # Also how often dormant enemies are woken
+AI_BUDGET_MS = 2.0                   # Time per frame the mid-range tier may use
+GRID_CELL_SIZE = 256                 # Spatial grid cell, in pixels
+
+# Field of view
+SIGHT_RADIUS = 10        # In tiles; covers the chase range
+FOV_CACHE_SIZE = 1024    # Remembered (tile, radius) results
+FOG_UNSEEN = 255         # Fog alpha over tiles never seen
+FOG_REMEMBERED = 150     # Fog alpha over tiles seen before but not now
+
+# Saving (F5 saves, F9 loads, hold R to rewind)
+SAVE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "savegame.bin")
+REWIND_INTERVAL = 6      # Frames between rewind snapshots
+REWIND_SNAPSHOTS = 100   # 10 seconds of rewind at 60 FPS
+
 # Colors (R, G, B)
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
@@ -49,8 +75,162 @@ def create_block_surface(color, width, height):
     pygame.draw.rect(surf, [c + 40 if c < 215 else 255 for c in color], (0, 0, width, height), 2)
     return surf
 
+# --- FIELD OF VIEW ---
+def tile_of(rect):
+    return (rect.centerx // TILE_SIZE, rect.centery // TILE_SIZE)
+
+# (xx, xy, yx, yy) transforms that map the first octant onto each of the eight
+OCTANTS = ((1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1),
+           (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1))
+
+class FieldOfView:
+    """Recursive shadowcasting over a tile map, memoized per (tile, radius).
+
+    Walls ('#') and everything off the map block sight. Results are
+    frozensets of visible (tx, ty) tiles; the least recently used ones are
+    dropped once more than cache_size are remembered.
+    """
+    def __init__(self, game_map, cache_size=FOV_CACHE_SIZE):
+        self.game_map = game_map
+        self.width, self.height = len(game_map[0]), len(game_map)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.computed = 0  # Cache misses, for benchmarking
+
+    def visible_from(self, tile, radius):
+        key = (tile, radius)
+        visible = self.cache.get(key)
+        if visible is None:
+            visible = self.compute(tile, radius)
+            self.cache[key] = visible
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(key)
+        return visible
+
+    def compute(self, tile, radius):
+        self.computed += 1
+        visible = {tile}
+        for octant in OCTANTS:
+            self._cast(tile, 1, 1.0, 0.0, radius, octant, visible)
+        return frozenset(visible)
+
+    def _blocks(self, x, y):
+        return not (0 <= x < self.width and 0 <= y < self.height) or self.game_map[y][x] == '#'
+
+    def _cast(self, tile, row, start, end, radius, octant, visible):
+        """Scans one octant row by row between the start and end slopes, recursing past walls."""
+        if start < end:
+            return
+        cx, cy = tile
+        xx, xy, yx, yy = octant
+        radius_sq = radius * radius
+        new_start = start
+        for j in range(row, radius + 1):
+            dx, dy = -j - 1, -j
+            blocked = False
+            while dx <= 0:
+                dx += 1
+                left_slope, right_slope = (dx - 0.5) / (dy + 0.5), (dx + 0.5) / (dy - 0.5)
+                if start < right_slope:
+                    continue
+                if end > left_slope:
+                    break
+                x, y = cx + dx * xx + dy * xy, cy + dx * yx + dy * yy
+                if dx * dx + dy * dy <= radius_sq:
+                    visible.add((x, y))
+                wall = self._blocks(x, y)
+                if blocked:
+                    if wall:
+                        new_start = right_slope
+                        continue
+                    blocked = False
+                    start = new_start
+                elif wall and j < radius:
+                    # Everything behind this wall is in shadow: scan the rest of the octant past it
+                    blocked = True
+                    self._cast(tile, j + 1, start, left_slope, radius, octant, visible)
+                    new_start = right_slope
+            if blocked:
+                break
+
+
+class FogOfWar:
+    """Darkens tiles the player can't see, from an alpha mask with one pixel per tile.
+
+    The mask only changes when the visible set does, and the scaled-up overlay
+    for the tiles on screen is cached until the mask or the view's tile changes.
+    """
+    def __init__(self, width, height):
+        self.mask = pygame.Surface((width, height), pygame.SRCALPHA)
+        self.mask.fill((0, 0, 0, FOG_UNSEEN))
+        self.visible = frozenset()
+        self.version = 0
+        self._overlay = None
+        self._overlay_key = None
+
+    def reveal(self, visible):
+        if visible is self.visible:
+            return
+        bounds = self.mask.get_rect()
+        for tile in self.visible - visible:
+            self.mask.set_at(tile, (0, 0, 0, FOG_REMEMBERED))
+        for tile in visible - self.visible:
+            if bounds.collidepoint(tile):
+                self.mask.set_at(tile, (0, 0, 0, 0))
+        self.visible = visible
+        self.version += 1
+
+    def draw(self, surface, offset):
+        tx, ty = int(offset.x) // TILE_SIZE, int(offset.y) // TILE_SIZE
+        key = (self.version, tx, ty)
+        if key != self._overlay_key:
+            # One tile of slack on each axis for the part of a tile the view is scrolled by
+            w, h = surface.get_width() // TILE_SIZE + 2, surface.get_height() // TILE_SIZE + 2
+            tiles = pygame.Surface((w, h), pygame.SRCALPHA)
+            tiles.fill((0, 0, 0, FOG_UNSEEN))
+            # Off the map stays unseen. The fog is all black, so MIN copies the mask's alpha
+            area = pygame.Rect(tx, ty, w, h).clip(self.mask.get_rect())
+            tiles.blit(self.mask, (area.x - tx, area.y - ty), area, special_flags=pygame.BLEND_RGBA_MIN)
+            self._overlay = pygame.transform.scale(tiles, (w * TILE_SIZE, h * TILE_SIZE))
+            self._overlay_key = key
+        surface.blit(self._overlay, (tx * TILE_SIZE - offset.x, ty * TILE_SIZE - offset.y))
+
 # --- CLASSES ---
 
+class ObstacleGroup(pygame.sprite.Group):
+    """Walls, indexed by tile so collision only looks at the tiles a rect overlaps."""
+    def __init__(self):
+        super().__init__()
+        self._tiles = None  # (tx, ty) -> [(group order, sprite)], built on first use
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        self._tiles = None  # Sprites get their rect after joining, so reindex lazily
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self._tiles = None
+
+    def index(self):
+        self._tiles = {}
+        for order, sprite in enumerate(self.sprites()):
+            self._tiles.setdefault((sprite.rect.x // TILE_SIZE, sprite.rect.y // TILE_SIZE), []).append((order, sprite))
+
+    def colliding(self, rect):
+        """Obstacles overlapping rect, in the same order spritecollide would return them."""
+        if self._tiles is None:
+            self.index()
+        # Obstacles are no bigger than a tile, so one that overlaps starts at most a tile up/left
+        hits = []
+        for ty in range(rect.top // TILE_SIZE - 1, (rect.bottom - 1) // TILE_SIZE + 1):
+            for tx in range(rect.left // TILE_SIZE - 1, (rect.right - 1) // TILE_SIZE + 1):
+                for order, sprite in self._tiles.get((tx, ty), ()):
+                    if rect.colliderect(sprite.rect):
+                        hits.append((order, sprite))
+        return [sprite for order, sprite in sorted(hits, key=lambda hit: hit[0])]
+
 class Wall(pygame.sprite.Sprite):
     def __init__(self, x, y, groups):
         super().__init__(groups)
@@ -79,8 +259,14 @@ class Player(pygame.sprite.Sprite):
         self.max_health = 100
         self.attack_cooldown = 0
 
-    def input(self):
-        keys = pygame.key.get_pressed()
+        # What the player can see, set up by Game and kept current by look()
+        self.fov = None
+        self.view_tile = None
+        self.visible = frozenset()
+
+    def input(self, keys=None):
+        if keys is None:
+            keys = pygame.key.get_pressed()
         dx, dy = 0, 0
         
         if keys[pygame.K_UP] or keys[pygame.K_w]:
@@ -108,7 +294,7 @@ class Player(pygame.sprite.Sprite):
         self.collision('y')
 
     def collision(self, direction):
-        hits = pygame.sprite.spritecollide(self, self.obstacles, False)
+        hits = self.obstacles.colliding(self.rect)
         if hits:
             if direction == 'x':
                 if self.rect.centerx < hits[0].rect.centerx: # Moving Right
@@ -135,8 +321,16 @@ class Player(pygame.sprite.Sprite):
                 enemy.take_damage(50)
                 print("Enemy Hit!")
 
-    def update(self):
-        self.input()
+    def look(self):
+        # Field of view only changes when the player steps onto another tile
+        tile = tile_of(self.rect)
+        if tile != self.view_tile:
+            self.view_tile = tile
+            self.visible = self.fov.visible_from(tile, SIGHT_RADIUS)
+
+    def update(self, keys=None):
+        self.input(keys)
+        self.look()
         if self.attack_cooldown > 0:
             self.attack_cooldown -= 1
             
@@ -187,7 +381,7 @@ class Enemy(pygame.sprite.Sprite):
 
     def collide(self, direction):
         # Wall collision for enemies
-        hits = pygame.sprite.spritecollide(self, self.obstacles, False)
+        hits = self.obstacles.colliding(self.rect)
         if hits:
             if direction == 'x':
                 if self.rect.centerx < hits[0].rect.centerx:
@@ -200,6 +394,9 @@ class Enemy(pygame.sprite.Sprite):
                 else:
                     self.rect.top = hits[0].rect.bottom
 
+    def can_see_player(self):
+        return tile_of(self.rect) in self.player.visible
+
     def take_damage(self, amount):
         self.health -= amount
         if self.health <= 0:
@@ -207,7 +404,7 @@ class Enemy(pygame.sprite.Sprite):
 
     def update(self):
         dist = ((self.rect.x - self.player.rect.x)**2 + (self.rect.y - self.player.rect.y)**2)**0.5
-        if dist < 300: # Only chase if within range
+        if dist < CHASE_RANGE and self.can_see_player(): # Only chase if within range and in sight
             self.move_towards_player()
             
         # Damage Player on touch
@@ -219,6 +416,166 @@ class Enemy(pygame.sprite.Sprite):
                 pygame.quit()
                 sys.exit()
 
+# --- AI SCHEDULING ---
+class SpatialGrid:
+    """Buckets sprites by the grid cell their top-left corner is in.
+
+    Sprites that move have to be re-bucketed with move(). Buckets are dicts so
+    iteration order (and therefore draw order) is deterministic.
+    """
+    def __init__(self, cell_size=GRID_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}  # (cx, cy) -> {sprite: None}
+        self.where = {}  # sprite -> (cx, cy)
+
+    def cell_of(self, rect):
+        return (rect.x // self.cell_size, rect.y // self.cell_size)
+
+    def add(self, sprite):
+        cell = self.cell_of(sprite.rect)
+        self.cells.setdefault(cell, {})[sprite] = None
+        self.where[sprite] = cell
+
+    def remove(self, sprite):
+        cell = self.where.pop(sprite, None)
+        if cell is not None:
+            bucket = self.cells[cell]
+            del bucket[sprite]
+            if not bucket:
+                del self.cells[cell]
+
+    def move(self, sprite):
+        cell = self.where.get(sprite)
+        if cell is not None and cell != self.cell_of(sprite.rect):
+            self.remove(sprite)
+            self.add(sprite)
+
+    def query(self, rect):
+        """Sprites whose rect may overlap rect (assuming they're no bigger than a tile)."""
+        x0, y0 = (rect.left - TILE_SIZE) // self.cell_size, (rect.top - TILE_SIZE) // self.cell_size
+        x1, y1 = rect.right // self.cell_size, rect.bottom // self.cell_size
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                bucket = self.cells.get((cx, cy))
+                if bucket:
+                    yield from bucket
+
+
+class AIScheduler:
+    """Decides which enemies think each frame, by distance to the player.
+
+    Near enemies (inside NEAR_RANGE, which covers the chase range) update
+    every frame, interleaved with the player in update_order, so anything
+    that can chase or touch the player behaves exactly as it did when
+    camera_group.update() updated every sprite. Mid-range enemies are woken
+    by a grid query every MID_INTERVAL frames and updated round-robin from a
+    queue, as far as the frame's time budget allows. Everything further away is dormant
+    and costs nothing until the player comes close enough to wake it.
+    """
+    def __init__(self, player, grid, near_range=NEAR_RANGE, mid_range=MID_RANGE,
+                 mid_interval=MID_INTERVAL, budget_ms=AI_BUDGET_MS):
+        self.player = player
+        self.grid = grid
+        self.near_range = near_range
+        self.mid_range = mid_range
+        self.mid_interval = mid_interval
+        self.budget = budget_ms / 1000
+        self.stats = {'near': 0, 'mid': 0, 'awake': 0, 'ms': 0.0}
+        self.reset()
+
+    def reset(self, frame=0):
+        """Forgets which enemies are awake, e.g. after everyone has been moved by loading a save."""
+        self.frame = frame
+        self.awake = deque()  # Mid-range enemies, next to update on the left
+        self.queued = set()
+        self.updated = []     # Enemies updated last frame; only these can have changed
+
+    def _nearby(self, radius):
+        """(enemy, squared distance) for live enemies around the player."""
+        px, py = self.player.rect.x, self.player.rect.y
+        area = pygame.Rect(px - radius, py - radius, radius * 2, radius * 2)
+        for sprite in self.grid.query(area):
+            if isinstance(sprite, Enemy) and sprite.alive():
+                yield sprite, (sprite.rect.x - px)**2 + (sprite.rect.y - py)**2
+
+    def update(self, update_player):
+        """Runs one frame: the player (by calling update_player) and whichever enemies are due."""
+        start = time.perf_counter()
+        near_sq, mid_sq = self.near_range**2, self.mid_range**2
+
+        # Near tier: every frame. The list is taken before anything moves, like Group.update()
+        # does, and the range leaves a tile of slack for the player's own move
+        near = sorted((enemy for enemy, dist_sq in self._nearby(self.near_range) if dist_sq < near_sq),
+                      key=lambda enemy: enemy.update_order)
+        player_done = False
+        for enemy in near:
+            if not player_done and enemy.update_order > self.player.update_order:
+                update_player()
+                player_done = True
+            enemy.update()
+            self.grid.move(enemy)
+        if not player_done:
+            update_player()
+
+        # Wake dormant enemies that the player has come within mid range of
+        if self.frame % self.mid_interval == 0:
+            for enemy, dist_sq in self._nearby(self.mid_range):
+                if near_sq <= dist_sq < mid_sq and enemy not in self.queued:
+                    self.queued.add(enemy)
+                    self.awake.append(enemy)
+
+        # Mid tier: a share of the queue per frame, so each one thinks about every MID_INTERVAL frames
+        in_near = set(near)
+        self.updated = list(near)
+        px, py = self.player.rect.x, self.player.rect.y
+        for _ in range(-(-len(self.awake) // self.mid_interval)):
+            if time.perf_counter() - start > self.budget:
+                break
+            enemy = self.awake.popleft()
+            dist_sq = (enemy.rect.x - px)**2 + (enemy.rect.y - py)**2
+            if not enemy.alive() or dist_sq >= mid_sq:
+                self.queued.discard(enemy)  # Back to sleep
+                continue
+            if dist_sq >= near_sq and enemy not in in_near:
+                enemy.update()
+                self.grid.move(enemy)
+                self.updated.append(enemy)
+            self.awake.append(enemy)
+
+        self.frame += 1
+        self.stats = {'near': len(near), 'mid': len(self.updated) - len(near), 'awake': len(self.awake),
+                      'ms': (time.perf_counter() - start) * 1000}
+
+
+# --- SAVE SNAPSHOTS ---
+# Only simulation state is stored, little-endian:
+#   header: magic, version, map id (CRC-32 of the layout), frame, number of enemies
+#   player: x, y, health, attack cooldown
+#   enemies: x, y, health for every enemy the map spawned, in map order (dead ones have health <= 0)
+SNAPSHOT_MAGIC = b'RPG3'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('<4sHIII')
+PLAYER_STATE = struct.Struct('<4i')
+ENEMY_STATE = struct.Struct('<3i')
+
+def layout_id(game_map):
+    return zlib.crc32('\n'.join(game_map).encode())
+
+def pack_snapshot(map_id, frame, player, enemy_states):
+    """player is (x, y, health, cooldown); enemy_states the packed ENEMY_STATE records."""
+    count = len(enemy_states) // ENEMY_STATE.size
+    return (SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, map_id, frame, count)
+            + PLAYER_STATE.pack(*player) + enemy_states)
+
+def unpack_snapshot(data):
+    """Inverse of pack_snapshot: returns (map id, frame, player, enemy states)."""
+    magic, version, snapshot_map, frame, count = SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError(f"not a version {SNAPSHOT_VERSION} save snapshot")
+    player = PLAYER_STATE.unpack_from(data, SNAPSHOT_HEADER.size)
+    start = SNAPSHOT_HEADER.size + PLAYER_STATE.size
+    return snapshot_map, frame, player, data[start:start + count * ENEMY_STATE.size]
+
 # --- CAMERA SYSTEM ---
 class CameraGroup(pygame.sprite.Group):
     """Custom Sprite Group that acts as a Camera (follows player)."""
@@ -228,12 +585,19 @@ class CameraGroup(pygame.sprite.Group):
         self.offset = pygame.math.Vector2()
         self.half_w = self.display_surface.get_size()[0] // 2
         self.half_h = self.display_surface.get_size()[1] // 2
+        # Sprites are also bucketed in a grid, so drawing only looks at what's on screen
+        self.grid = SpatialGrid()
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self.grid.remove(sprite)
 
     def center_target_camera(self, target):
         self.offset.x = target.rect.centerx - self.half_w
         self.offset.y = target.rect.centery - self.half_h
 
     def custom_draw(self, player):
+        self.grid.move(player)
         self.center_target_camera(player)
 
         # Draw floor
@@ -242,65 +606,192 @@ class CameraGroup(pygame.sprite.Group):
         self.display_surface.fill(FLOOR_COLOR)
 
         # Sort sprites by Y coordinate so sprites lower down overlap ones higher up (depth)
-        for sprite in sorted(self.sprites(), key=lambda s: s.rect.centery):
+        view = pygame.Rect(self.offset, self.display_surface.get_size())
+        for sprite in sorted(self.grid.query(view), key=lambda s: s.rect.centery):
             offset_pos = sprite.rect.topleft - self.offset
             self.display_surface.blit(sprite.image, offset_pos)
 
 # --- MAIN GAME SETUP ---
-
-def main():
-    pygame.init()
-    screen = pygame.display.set_mode((WIDTH, HEIGHT))
-    pygame.display.set_caption("Pygame Top-Down RPG")
-    clock = pygame.time.Clock()
-
-    # Groups
-    camera_group = CameraGroup()
-    obstacles_group = pygame.sprite.Group()
-    enemies_group = pygame.sprite.Group()
-
-    # Map Generation
-    player = None
-    for row_index, row in enumerate(GAME_MAP):
-        for col_index, col in enumerate(row):
-            x = col_index
-            y = row_index
-            if col == '#':
-                Wall(x, y, [camera_group, obstacles_group])
-            elif col == 'P':
-                player = Player(x, y, obstacles_group, enemies_group, [camera_group])
-            elif col == 'E':
-                Enemy(x, y, player, obstacles_group, [camera_group, enemies_group])
-
-    # Pass player reference to enemies after creation (if any existed before player)
-    for enemy in enemies_group:
-        enemy.player = player
-
-    # --- GAME LOOP ---
-    running = True
-    while running:
-        # 1. Event Handling
+class Game:
+    """One level: the map's walls, enemies and player, the AI scheduler that updates
+    them, the fog of war, the rewind history and the save file. benchmark_second.py
+    builds these under SDL's dummy video driver and steps them without a window.
+    """
+    def __init__(self, game_map=GAME_MAP, screen_size=(WIDTH, HEIGHT)):
+        pygame.init()
+        self.screen = pygame.display.set_mode(screen_size)
+        pygame.display.set_caption("Pygame Top-Down RPG")
+        self.clock = pygame.time.Clock()
+        self.map_id = layout_id(game_map)
+        self.fov = FieldOfView(game_map)
+        self.fog = FogOfWar(len(game_map[0]), len(game_map))
+        self.history = deque(maxlen=REWIND_SNAPSHOTS)
+        self._save_thread = None
+
+        # Groups
+        self.camera_group = CameraGroup()
+        self.obstacles_group = ObstacleGroup()
+        self.enemies_group = pygame.sprite.Group()
+
+        # Map Generation
+        self.player = None
+        for row_index, row in enumerate(game_map):
+            for col_index, col in enumerate(row):
+                x = col_index
+                y = row_index
+                if col == '#':
+                    Wall(x, y, [self.camera_group, self.obstacles_group])
+                elif col == 'P':
+                    self.player = Player(x, y, self.obstacles_group, self.enemies_group, [self.camera_group])
+                elif col == 'E':
+                    Enemy(x, y, self.player, self.obstacles_group, [self.camera_group, self.enemies_group])
+
+        # Pass player reference to enemies after creation (if any existed before player)
+        for enemy in self.enemies_group:
+            enemy.player = self.player
+        # Every enemy ever spawned, in map order, each with a slot in enemy_states. Only
+        # enemies the scheduler updates can change, so only their slots are rewritten
+        self.enemies = self.enemies_group.sprites()
+        self.enemy_states = bytearray(ENEMY_STATE.size * len(self.enemies))
+        for index, enemy in enumerate(self.enemies):
+            enemy.spawn_index = index
+            self.record(enemy)
+        self.player.fov = self.fov
+        self.player.look()
+
+        # Sprites only have a rect once they're built, so they're bucketed and indexed here. The scheduler
+        # keeps the order camera_group.update() used to update them in
+        for index, sprite in enumerate(self.camera_group):
+            self.camera_group.grid.add(sprite)
+            sprite.update_order = index
+        self.obstacles_group.index()
+
+        # Enemies are updated by the scheduler rather than by camera_group.update()
+        self.ai = AIScheduler(self.player, self.camera_group.grid)
+
+    def handle_events(self):
+        """ESC or closing the window returns False; F5 saves and F9 loads the save file."""
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
-                running = False
+                return False
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
-                    running = False
-
-        # 2. Update
-        camera_group.update()
+                    return False
+                if event.key == pygame.K_F5:
+                    self.save()
+                if event.key == pygame.K_F9 and os.path.exists(SAVE_PATH):
+                    try:
+                        self.load()
+                    except (OSError, ValueError, zlib.error, struct.error) as error:
+                        # A save for another map or version, or a damaged file, is ignored
+                        print(f"Could not load {SAVE_PATH}: {error}")
+        return True
+
+    def update(self, keys=None):
+        if keys is None:
+            keys = pygame.key.get_pressed()
+        if keys[pygame.K_r] and self.history:
+            # Rewinding: step back through the snapshots instead of simulating
+            self.restore(self.history.pop())
+            return
+        if self.ai.frame % REWIND_INTERVAL == 0:
+            self.history.append(self.snapshot())
+        self.ai.update(lambda: self.player.update(keys))
+        for enemy in self.ai.updated:
+            self.record(enemy)
+
+    # --- Saving ---
+    def record(self, enemy):
+        ENEMY_STATE.pack_into(self.enemy_states, enemy.spawn_index * ENEMY_STATE.size, *enemy.rect.topleft, enemy.health)
+
+    def snapshot(self):
+        """The simulation state as bytes (see pack_snapshot). Sprites and surfaces aren't included."""
+        player = self.player
+        return pack_snapshot(self.map_id, self.ai.frame,
+                             (player.rect.x, player.rect.y, player.health, player.attack_cooldown), self.enemy_states)
+
+    def restore(self, data):
+        """Puts the game back in the state a snapshot was taken in. What has been explored stays explored."""
+        snapshot_map, frame, (x, y, health, cooldown), enemy_states = unpack_snapshot(data)
+        if snapshot_map != self.map_id:
+            raise ValueError("snapshot is for a different map")
+        if len(enemy_states) != len(self.enemy_states):
+            raise ValueError("snapshot has a different number of enemies")
+        player = self.player
+        player.rect.topleft = (x, y)
+        player.health, player.attack_cooldown = health, cooldown
+        player.view_tile = None
+        player.look()
+
+        # Only enemies whose record differs need touching; most are dormant and haven't changed
+        old = np.frombuffer(self.enemy_states, '<i4').reshape(-1, 3)
+        new = np.frombuffer(enemy_states, '<i4').reshape(-1, 3)
+        changed = np.flatnonzero((old != new).any(axis=1)).tolist()
+        grid = self.camera_group.grid
+        for index, (x, y, health) in zip(changed, new[changed].tolist()):
+            enemy = self.enemies[index]
+            enemy.health = health
+            if enemy.alive():
+                enemy.rect.topleft = (x, y)
+                grid.move(enemy)
+                if health <= 0:
+                    enemy.kill()
+            elif health > 0:
+                enemy.rect.topleft = (x, y)
+                enemy.add(self.camera_group, self.enemies_group)
+                grid.add(enemy)
+        self.enemy_states[:] = enemy_states
+        self.ai.reset(frame)
+
+    def save(self, path=SAVE_PATH):
+        """Snapshots now; compressing and writing the file happen on a background thread."""
+        data = self.snapshot()
+        self.wait_for_save()
+        self._save_thread = threading.Thread(target=self._write_save, args=(path, data))
+        self._save_thread.start()
+
+    def _write_save(self, path, data):
+        with open(path + '.tmp', 'wb') as f:
+            f.write(zlib.compress(data, 1))
+        os.replace(path + '.tmp', path)
+
+    def wait_for_save(self):
+        if self._save_thread is not None:
+            self._save_thread.join()
+            self._save_thread = None
+
+    def load(self, path=SAVE_PATH):
+        self.wait_for_save()
+        with open(path, 'rb') as f:
+            self.restore(zlib.decompress(f.read()))
+
+    def draw(self):
+        self.camera_group.custom_draw(self.player)
+        self.fog.reveal(self.player.visible)
+        self.fog.draw(self.screen, self.camera_group.offset)
 
-        # 3. Draw
-        camera_group.custom_draw(player)
-        
         # Draw HUD (Health bar) separate from camera offset
-        player.draw_ui(screen)
+        self.player.draw_ui(self.screen)
 
         pygame.display.flip()
-        clock.tick(FPS)
 
-    pygame.quit()
-    sys.exit()
+    def step(self, keys=None):
+        """A frame of AI, rewind and drawing as fast as it runs, for benchmarks."""
+        self.update(keys)
+        self.draw()
+
+    def run(self):
+        # --- GAME LOOP ---
+        while self.handle_events():
+            self.step()
+            self.clock.tick(FPS)
+
+        self.wait_for_save()
+        pygame.quit()
+        sys.exit()
+
+def main():
+    Game().run()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,376 @@
+"""Networked play for fourth.py: a headless asyncio server that owns the World, and
+clients that mirror it.
+
+    python world_server.py --seed 1            # run a server on port 8765
+    python fourth.py --connect localhost:8765  # join it
+
+The server streams whole chunk columns (zlib-compressed block ids) to each client,
+nearest first, out to its view distance. Edits from clients are applied to the
+server's world once per tick, and whatever add_block/remove_block changed is sent
+back out as one coalesced, compressed delta per client per tick. Clients apply
+deltas to their own World, which relights and marks meshes dirty as usual.
+"""
+import argparse
+import asyncio
+import logging
+import math
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+
+import numpy as np
+from fourth import BLOCK_NAMES, BLOCKS, CHUNK_SHIFT, CHUNK_SIZE, World
+
+# --- Settings ---
+DEFAULT_PORT = 8765
+TICK_RATE = 20               # Server ticks per second
+VIEW_DISTANCE = 128          # Blocks around a client to stream
+COLUMNS_PER_TICK = 8         # Chunk columns streamed to each client per tick
+COLUMNS_PER_FRAME = 1        # Streamed columns a game client loads per frame; each relights its surroundings
+MAX_WRITE_BUFFER = 1 << 20   # Stop streaming chunks to a client that isn't keeping up
+MAX_COORDINATE = 1 << 24     # Positions further out than this (or not finite) are ignored
+MAX_CLIENT_MESSAGE = 1 << 16 # Largest client message, before and after decompression
+
+# --- Protocol ---
+# Every message is a (type, length) header followed by the payload
+HEADER = struct.Struct('!BI')
+POSITION = 1  # client -> server: x, y, z as three floats
+EDITS = 2     # both ways: compressed EDIT_RECORDs
+CHUNKS = 3    # server -> client: compressed chunk count, keys and block ids
+POSITION_FORMAT = struct.Struct('!3f')
+EDIT_RECORD = np.dtype([('x', '>i4'), ('y', '>i4'), ('z', '>i4'), ('block', 'u1')])
+CHUNK_COUNT = struct.Struct('!I')
+
+log = logging.getLogger(__name__)
+
+
+def frame(message_type, payload):
+    return HEADER.pack(message_type, len(payload)) + payload
+
+async def read_message(reader, max_length=None):
+    """Returns (type, payload); raises asyncio.IncompleteReadError when the peer disconnects,
+    and ValueError for a message longer than max_length."""
+    message_type, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if max_length is not None and length > max_length:
+        raise ValueError(f"{length} byte message is over the {max_length} byte limit")
+    return message_type, await reader.readexactly(length)
+
+def inflate(payload, max_length=None):
+    """zlib.decompress, raising ValueError if the data would come to more than max_length bytes."""
+    if max_length is None:
+        return zlib.decompress(payload)
+    inflater = zlib.decompressobj()
+    data = inflater.decompress(payload, max_length)
+    if inflater.unconsumed_tail:
+        raise ValueError(f"message inflates past the {max_length} byte limit")
+    if not inflater.eof:
+        raise zlib.error("truncated message")
+    return data
+
+def encode_edits(edits):
+    """{(x, y, z): block id} -> payload. Block id 0 removes the block."""
+    records = np.array([(x, y, z, block_id) for (x, y, z), block_id in edits.items()], EDIT_RECORD)
+    return zlib.compress(records.tobytes())
+
+def decode_edits(payload, max_length=None):
+    records = np.frombuffer(inflate(payload, max_length), EDIT_RECORD)
+    return {(int(r['x']), int(r['y']), int(r['z'])): int(r['block']) for r in records}
+
+def encode_chunks(chunks):
+    keys = np.array([chunk.key for chunk in chunks], '>i4')
+    body = b''.join(bytes(chunk.data[BLOCKS]) for chunk in chunks)
+    return zlib.compress(CHUNK_COUNT.pack(len(chunks)) + keys.tobytes() + body)
+
+def decode_chunks(payload):
+    """payload -> {key: [x, y, z] block id array}"""
+    raw = zlib.decompress(payload)
+    count, = CHUNK_COUNT.unpack_from(raw)
+    keys = np.frombuffer(raw, '>i4', count * 3, CHUNK_COUNT.size).reshape(count, 3)
+    blocks = np.frombuffer(raw, np.uint8, offset=CHUNK_COUNT.size + keys.nbytes).reshape(count, CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE)
+    return {tuple(int(c) for c in key): array for key, array in zip(keys, blocks)}
+
+def column_of(pos):
+    return (pos[0] >> CHUNK_SHIFT, pos[2] >> CHUNK_SHIFT)
+
+
+# --- Server ---
+class Connection:
+    """The server's view of one client."""
+    def __init__(self, writer):
+        self.writer = writer
+        self.position = None   # Last reported position; nothing is streamed before the first
+        self.columns = set()   # Chunk columns (cx, cz) already sent
+        self.complete = None   # (centre column, column count) at which every column in view had been sent
+        self.bytes_sent = 0
+
+    def send(self, message_type, payload):
+        data = frame(message_type, payload)
+        self.writer.write(data)
+        self.bytes_sent += len(data)
+
+
+class WorldServer:
+    """Owns the authoritative World and keeps connected clients in sync with it."""
+    def __init__(self, world, view_distance=VIEW_DISTANCE, tick_rate=TICK_RATE):
+        self.world = world
+        self.view_distance = view_distance
+        self.tick_interval = 1 / tick_rate
+        self.connections = set()
+        self.pending = {}   # Edits received since the last tick, last one per position wins
+        self.changes = {}   # What add_block/remove_block actually changed this tick
+        self.tick_times = deque(maxlen=1000)
+        self._columns = {}  # (cx, cz) -> chunks, rebuilt when chunks are created
+        self._encoded = {}  # (cx, cz) -> CHUNKS payload, dropped when the column changes
+        self._handlers = set()
+        self._server = None
+        self._ticker = None
+        world.edit_listeners.append(self._on_world_edit)
+
+    async def start(self, host='127.0.0.1', port=DEFAULT_PORT):
+        """Starts listening and ticking. Returns the port (useful with port 0)."""
+        self._server = await asyncio.start_server(self._serve_client, host, port)
+        self._ticker = asyncio.create_task(self._run())
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._ticker.cancel()
+        self._server.close()
+        for connection in list(self.connections):
+            connection.writer.close()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        await self._server.wait_closed()
+
+    async def _serve_client(self, reader, writer):
+        connection = Connection(writer)
+        self.connections.add(connection)
+        self._handlers.add(asyncio.current_task())
+        try:
+            while True:
+                message_type, payload = await read_message(reader, MAX_CLIENT_MESSAGE)
+                if message_type == POSITION:
+                    position = POSITION_FORMAT.unpack(payload)
+                    if all(math.isfinite(c) and abs(c) <= MAX_COORDINATE for c in position):
+                        connection.position = position
+                elif message_type == EDITS:
+                    for pos, block_id in decode_edits(payload, MAX_CLIENT_MESSAGE).items():
+                        if block_id < len(BLOCK_NAMES):
+                            self.pending[pos] = block_id
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except (ValueError, struct.error, zlib.error) as error:
+            # Oversized or malformed: drop this client, nobody else is affected
+            log.warning("closing %s: %s", writer.get_extra_info('peername'), error)
+        finally:
+            self.connections.discard(connection)
+            self._handlers.discard(asyncio.current_task())
+            writer.close()
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            try:
+                self.tick()
+            except Exception:
+                # Keep serving everyone else; whatever broke is in the log
+                log.exception("server tick failed")
+            await asyncio.sleep(max(0.0, self.tick_interval - (time.perf_counter() - start)))
+
+    def _on_world_edit(self, pos, block_id):
+        self.changes[pos] = block_id
+        self._encoded.pop(column_of(pos), None)
+
+    def tick(self):
+        """Applies queued edits, then sends each client one delta and its next chunk columns."""
+        start = time.perf_counter()
+        pending, self.pending = self.pending, {}
+        for pos, block_id in pending.items():
+            current = self.world.get_block(pos)
+            if current == BLOCK_NAMES[block_id]:
+                continue
+            if block_id:
+                self.world.add_block(pos, BLOCK_NAMES[block_id])
+            else:
+                self.world.remove_block(pos)
+
+        changes, self.changes = self.changes, {}
+        if sum(len(chunks) for chunks in self._columns.values()) != len(self.world.chunks):
+            self._columns = {}
+            for chunk in self.world.chunks.values():
+                self._columns.setdefault((chunk.key[0], chunk.key[2]), []).append(chunk)
+        encoded = {}  # Clients in the same area get the same delta, which is compressed once
+        for connection in list(self.connections):
+            # Clients only hear about columns they have; the rest arrive up to date when streamed
+            visible = tuple(pos for pos in changes if column_of(pos) in connection.columns)
+            if visible:
+                if visible not in encoded:
+                    encoded[visible] = encode_edits({pos: changes[pos] for pos in visible})
+                connection.send(EDITS, encoded[visible])
+            self._stream_columns(connection)
+        self.tick_times.append(time.perf_counter() - start)
+
+    def _stream_columns(self, connection):
+        if connection.position is None or connection.writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+            return
+        x, _, z = connection.position
+        centre = (int(x) >> CHUNK_SHIFT, int(z) >> CHUNK_SHIFT)
+        if connection.complete == (centre, len(self._columns)):
+            return  # Nothing new in view since everything in it was sent
+        radius = self.view_distance // CHUNK_SIZE
+        wanted = []
+        for cx in range(centre[0] - radius, centre[0] + radius + 1):
+            for cz in range(centre[1] - radius, centre[1] + radius + 1):
+                distance = (cx - centre[0]) ** 2 + (cz - centre[1]) ** 2
+                if distance <= radius * radius and (cx, cz) not in connection.columns:
+                    wanted.append((distance, (cx, cz)))
+        wanted.sort()
+
+        sent = 0
+        for _, column in wanted:
+            # Empty columns are recorded too, so edits that create chunks there still reach the client
+            connection.columns.add(column)
+            chunks = self._columns.get(column)
+            if chunks:
+                # Clients nearby want the same columns, so each is compressed once
+                if column not in self._encoded:
+                    self._encoded[column] = encode_chunks(chunks)
+                connection.send(CHUNKS, self._encoded[column])
+                sent += 1
+                if sent == COLUMNS_PER_TICK:
+                    return
+        connection.complete = (centre, len(self._columns))
+
+
+# --- Client ---
+class WorldClient:
+    """Mirrors a server's world.
+
+    Received messages queue up in `inbox` and are applied by apply_pending(), so a
+    game can apply them between frames on its own thread. Edits made to the local
+    world with add_block/remove_block are shown at once and sent to the server,
+    whose delta then confirms (or overrides) them. With mirror=False the client
+    keeps no world and only counts what it receives, for load testing.
+    """
+    def __init__(self, mirror=True):
+        self.world = World(generate=False) if mirror else None
+        self.inbox = deque()
+        self.received = asyncio.Event()
+        self.bytes_received = 0
+        self.reader = self.writer = self.loop = None
+        self._applying = False
+        if mirror:
+            self.world.edit_listeners.append(self._on_local_edit)
+
+    async def connect(self, host='127.0.0.1', port=DEFAULT_PORT):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.loop = asyncio.get_running_loop()
+
+    async def receive(self):
+        """Reads messages until the server goes away."""
+        try:
+            while True:
+                message_type, payload = await read_message(self.reader)
+                self.bytes_received += HEADER.size + len(payload)
+                if self.world is not None:
+                    self.inbox.append((message_type, payload))
+                    self.received.set()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    def apply_pending(self, max_columns=None):
+        """Applies what has been received, in order. Returns the {pos: block id} edits applied.
+
+        Each streamed column is loaded (and the columns around it relit) on its own, which
+        keeps the relit area small. With max_columns, applying stops after that many columns
+        and the rest waits for the next call, so joining doesn't stall the frame.
+        """
+        applied = {}
+        columns = 0
+        while self.inbox and columns != max_columns:
+            message_type, payload = self.inbox.popleft()
+            if message_type == CHUNKS:
+                self.world.load_chunks(decode_chunks(payload))
+                columns += 1
+            elif message_type == EDITS:
+                edits = decode_edits(payload)
+                self._applying = True
+                try:
+                    for pos, block_id in edits.items():
+                        if block_id:
+                            self.world.add_block(pos, BLOCK_NAMES[block_id])
+                        else:
+                            self.world.remove_block(pos)
+                finally:
+                    self._applying = False
+                applied.update(edits)
+        return applied
+
+    def send_position(self, pos):
+        self._send(POSITION, POSITION_FORMAT.pack(*pos))
+
+    def send_edits(self, edits):
+        """Asks the server to set {pos: block id} (0 removes)."""
+        if edits:
+            self._send(EDITS, encode_edits(edits))
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.writer.close)
+
+    def _send(self, message_type, payload):
+        # Thread-safe, so a game loop running outside the event loop can send
+        self.loop.call_soon_threadsafe(self.writer.write, frame(message_type, payload))
+
+    def _on_local_edit(self, pos, block_id):
+        if not self._applying:
+            self.send_edits({pos: block_id})
+
+
+def connect_in_background(host, port=DEFAULT_PORT, timeout=5):
+    """Connects a mirroring client on a background thread running its own event loop,
+    for use from a game loop that calls apply_pending() every frame."""
+    client = WorldClient()
+    connected = threading.Event()
+    errors = []
+
+    async def run():
+        try:
+            await client.connect(host, port)
+        except OSError as error:
+            errors.append(error)
+            return
+        finally:
+            connected.set()
+        await client.receive()
+
+    threading.Thread(target=asyncio.run, args=(run(),), daemon=True).start()
+    if not connected.wait(timeout):
+        raise ConnectionError(f"timed out connecting to {host}:{port}")
+    if errors:
+        raise ConnectionError(f"could not connect to {host}:{port}: {errors[0]}")
+    return client
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless world server for fourth.py")
+    parser.add_argument("--seed", type=int, help="generate deep terrain from this seed instead of the flat floor")
+    parser.add_argument("--host", default='0.0.0.0')
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--view-distance", type=int, default=VIEW_DISTANCE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    async def serve():
+        server = WorldServer(World(args.seed), args.view_distance)
+        port = await server.start(args.host, args.port)
+        print(f"serving {len(server.world.chunks)} chunks on {args.host}:{port}")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
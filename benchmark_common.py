@@ -0,0 +1,17 @@
+"""Helpers shared by the games' benchmark scripts, which import this from the folder above them."""
+
+
+class HeldKeys:
+    """Stands in for pygame.key.get_pressed() with a fixed set of held keys."""
+    def __init__(self, *held):
+        self.held = set(held)
+
+    def __getitem__(self, key):
+        return key in self.held
+
+
+def random_walls(width, height, wall_chance, rng):
+    """Rows of booleans, True for a wall: a solid border around cells that are walls
+    with probability wall_chance, drawn from rng row by row."""
+    return [[x in (0, width - 1) or y in (0, height - 1) or rng.random() < wall_chance
+             for x in range(width)] for y in range(height)]
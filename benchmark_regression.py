@@ -0,0 +1,194 @@
+"""Headless performance regression check across the four pygame games.
+
+Times the hot paths each game's benchmark script lists in regression_cases(),
+writes the results as JSON and compares them against a stored baseline:
+
+    python benchmark_regression.py                  # compare against benchmark_baseline.json
+    python benchmark_regression.py --save-baseline  # record a new baseline on this machine
+    python benchmark_regression.py --no-gl --filter collide
+
+Each script runs in its own process, from its own folder, with SDL's dummy video
+driver; the OpenGL cases get an offscreen EGL context (Mesa's software renderer
+works) and are skipped where there is none. A case slower than the baseline by
+more than the threshold is timed again in a fresh process; if it is still slower,
+the run exits with status 1.
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(ROOT, "benchmark_baseline.json")
+SUITES = [
+    ("Gemini-2.5-Pro", "benchmark_second"),
+    ("Gemini-2.5-Pro", "benchmark_fourth"),
+    ("Gemini-3-Pro", "benchmark_second"),
+    ("Gemini-3-Pro", "benchmark_fourth"),
+]
+REPEATS = 9
+MIN_REPEAT_S = 0.05  # Calls are batched until one repeat takes at least this long
+THRESHOLD = 0.5      # Allowed slowdown of the best repeat before a case counts as a regression
+
+
+# --- Worker (one process per benchmark script) ---
+
+def time_case(function, repeats=REPEATS):
+    """Per-call times of the best and median repeat, timeit style."""
+    timer = timeit.Timer(function)
+    number = 1
+    while timer.timeit(number) < MIN_REPEAT_S:
+        number *= 2
+    times = [timer.timeit(number) / number for _ in range(repeats)]
+    return {"min": min(times), "median": statistics.median(times), "number": number}
+
+
+def run_worker(module_name, pattern, names=None):
+    """Times every matching case of one benchmark script and prints the results as JSON."""
+    module = importlib.import_module(module_name)
+    suite = f"{os.path.basename(os.getcwd())}/{module_name}"
+    results = {}
+    for name, function in module.regression_cases():
+        name = f"{suite}: {name}"
+        if pattern not in name or (names and name not in names):
+            continue
+        function()  # Warm up caches before timing
+        results[name] = time_case(function)
+        print(f"  {name}: {results[name]['min'] * 1e6:.1f} us", file=sys.stderr, flush=True)
+    print(json.dumps(results))
+
+
+# --- Runner ---
+
+def run_suite(folder, module_name, pattern, gl, names=()):
+    """Runs one benchmark script in a fresh process; returns {case: timings} or None if it failed."""
+    # A fixed hash seed keeps dict and set layouts, and so the timings, the same from run to run
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy", PYTHONHASHSEED="0")
+    command = [sys.executable, os.path.abspath(__file__), "--worker", module_name]
+    command += ["--filter", pattern]
+    for name in names:
+        command += ["--case", name]
+    if gl:
+        command.append("--gl")
+    print(f"{folder}/{module_name}.py", file=sys.stderr, flush=True)
+    process = subprocess.run(command, cwd=os.path.join(ROOT, folder), env=env, stdout=subprocess.PIPE, text=True)
+    if process.returncode != 0:
+        print(f"  failed with exit status {process.returncode}", file=sys.stderr)
+        return None
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def run_suites(pattern, gl, names=()):
+    """Runs every suite with a matching case; returns {case: timings} and the suites that failed."""
+    cases, failed = {}, []
+    for folder, module_name in SUITES:
+        suite = f"{folder}/{module_name}"
+        suite_names = [name for name in names if name.startswith(suite + ": ")]
+        if names and not suite_names:
+            continue
+        results = run_suite(folder, module_name, pattern, gl, suite_names)
+        if results is None:
+            failed.append(suite)
+        else:
+            cases.update(results)
+    return cases, failed
+
+
+def slower(results, baseline, threshold):
+    """Names of the cases slower than the baseline by more than the threshold."""
+    return [name for name in results if name in baseline and results[name]["min"] > baseline[name]["min"] * (1 + threshold)]
+
+
+def compare(results, baseline, threshold):
+    """Prints each case against the baseline; returns the names of the cases that regressed."""
+    regressions = []
+    for name in sorted(set(results) | set(baseline)):
+        if name not in results:
+            print(f"{'skipped':>10}  {name}")
+            continue
+        current = results[name]["min"] * 1e6
+        if name not in baseline:
+            print(f"{'new':>10}  {name}: {current:.1f} us")
+            continue
+        reference = baseline[name]["min"] * 1e6
+        change = current / reference - 1
+        status = "ok"
+        if name in slower(results, baseline, threshold):
+            status = "REGRESSED"
+            regressions.append(name)
+        print(f"{status:>10}  {name}: {current:.1f} us vs {reference:.1f} us ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--save-baseline", action="store_true", help=f"write the results to {os.path.basename(BASELINE_PATH)}")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON to compare against")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="allowed slowdown, as a fraction (default %(default)s)")
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this")
+    parser.add_argument("--no-gl", action="store_true", help="skip the cases that need an OpenGL context")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--gl", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--case", action="append", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        sys.path.insert(0, os.getcwd())
+        run_worker(args.worker, args.filter, args.case)
+        return 0
+
+    cases, failed = run_suites(args.filter, gl=not args.no_gl)
+    baseline = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["cases"]
+        # A case can be slow just because the machine was busy; only one that is slow twice counts
+        retry = slower(cases, baseline, args.threshold)
+        if retry:
+            print(f"re-timing {len(retry)} slower cases", file=sys.stderr)
+            again, _ = run_suites(args.filter, not args.no_gl, retry)
+            for name, timings in again.items():
+                if timings["min"] < cases[name]["min"]:
+                    cases[name] = timings
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "cases": cases,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        # Cases that were filtered out or skipped keep their old timings
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                report["cases"] = dict(json.load(f)["cases"], **cases)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"saved {len(cases)} cases to {args.baseline}")
+        return 1 if failed else 0
+
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --save-baseline first")
+        return 1
+    if args.filter:
+        baseline = {name: timings for name, timings in baseline.items() if args.filter in name}
+    regressions = compare(cases, baseline, args.threshold)
+    for suite in failed:
+        print(f"{suite} failed to run")
+    if regressions:
+        print(f"{len(regressions)} of {len(cases)} cases regressed by more than {args.threshold:.0%}")
+    return 1 if regressions or failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())